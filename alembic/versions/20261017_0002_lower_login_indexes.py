@@ -0,0 +1,28 @@
+"""lower() indexes for case-insensitive login
+
+Revision ID: 20261017_0002_lower_login_indexes
+Revises: 20251009_0001_init_users
+Create Date: 2026-10-17 12:00:00 UTC
+
+Los índices son únicos: si existen usuarios cuyo email o username sólo
+difieren en mayúsculas/minúsculas, hay que resolverlos antes de migrar.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261017_0002_lower_login_indexes"
+down_revision = "20251009_0001_init_users"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_email_lower", "users", [sa.text("lower(email)")], unique=True)
+    op.create_index("ix_users_username_lower", "users", [sa.text("lower(username)")], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_username_lower", table_name="users")
+    op.drop_index("ix_users_email_lower", table_name="users")
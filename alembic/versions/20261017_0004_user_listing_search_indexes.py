@@ -0,0 +1,42 @@
+"""indexes for user listing and prefix search
+
+Revision ID: 20261017_0004_user_listing_search_indexes
+Revises: 20261017_0003_user_events_outbox
+Create Date: 2026-10-17 14:00:00 UTC
+
+- (created_at, id): paginación keyset de GET /v1/users
+- lower(username) text_pattern_ops: LIKE 'prefijo%' sin depender del collation
+- pg_trgm sobre lower(username) / lower(full_name): coincidencias dentro del nombre
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261017_0004_user_listing_search_indexes"
+down_revision = "20261017_0003_user_events_outbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index("ix_users_created_at_id", "users", ["created_at", "id"])
+    op.create_index(
+        "ix_users_username_prefix", "users", [sa.text("lower(username) text_pattern_ops")]
+    )
+    op.create_index(
+        "ix_users_username_trgm", "users", [sa.text("lower(username) gin_trgm_ops")],
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_users_full_name_trgm", "users", [sa.text("lower(full_name) gin_trgm_ops")],
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_full_name_trgm", table_name="users")
+    op.drop_index("ix_users_username_trgm", table_name="users")
+    op.drop_index("ix_users_username_prefix", table_name="users")
+    op.drop_index("ix_users_created_at_id", table_name="users")
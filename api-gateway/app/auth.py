@@ -1,6 +1,9 @@
+import time
+from dataclasses import dataclass
 from fastapi import Header, HTTPException, status
 from jose import JWTError, jwt
-from typing import Optional
+from typing import Any, Dict, Optional
+from .cache import TTLCache
 from .config import settings
 
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -8,23 +11,50 @@ from fastapi import Depends
 
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# token -> claims ya verificados; nunca se guarda un token inválido
+_verified_tokens = TTLCache(settings.JWT_CACHE_MAX_ENTRIES, settings.JWT_CACHE_TTL_SECONDS)
+
+
+@dataclass(frozen=True)
+class AuthContext:
+    """Token crudo (para reenviarlo a los microservicios) y sus claims."""
+    token: str
+    claims: Dict[str, Any]
+
+
+def decode_token(token: str) -> Dict[str, Any]:
     """
-    Dependency para extraer y validar el JWT token.
-    Retorna el payload del token si es válido.
+    Verifica el JWT y retorna sus claims, usando el cache de tokens verificados.
+    Lanza JWTError si el token es inválido o expiró.
     """
-    token = credentials.credentials
+    now = time.time()
+    claims = _verified_tokens.get(token)
+    if claims is not None:
+        if claims.get("exp") is not None and claims["exp"] <= now:
+            _verified_tokens.invalidate(token)
+            raise JWTError("Signature has expired.")
+        return claims
     
+    claims = jwt.decode(
+        token,
+        settings.JWT_SECRET,
+        algorithms=[settings.JWT_ALG]
+    )
+    # La entrada nunca vive más allá del exp del token
+    ttl = settings.JWT_CACHE_TTL_SECONDS
+    if isinstance(claims.get("exp"), (int, float)):
+        ttl = min(ttl, claims["exp"] - now)
+    if ttl > 0:
+        _verified_tokens.set(token, claims, ttl)
+    return claims
+
+
+async def get_auth(credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthContext:
+    """
+    Dependency que valida el JWT una sola vez y retorna el token y sus claims.
+    """
     try:
-        # Decodificar y validar el JWT
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALG]
-        )
-        
-        return payload
-        
+        return AuthContext(token=credentials.credentials, claims=decode_token(credentials.credentials))
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -32,6 +62,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         )
 
 
+async def get_current_user(auth: AuthContext = Depends(get_auth)):
+    """
+    Dependency para extraer y validar el JWT token.
+    Retorna el payload del token si es válido.
+    """
+    return auth.claims
+
+
 def optional_auth(authorization: Optional[str] = Header(None)):
     """
     Dependency para autenticación opcional.
@@ -45,11 +83,6 @@ def optional_auth(authorization: Optional[str] = Header(None)):
         if scheme.lower() != "bearer":
             return None
         
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALG]
-        )
-        return payload
+        return decode_token(token)
     except:
         return None
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+SendOne = Callable[[Any], Awaitable[Any]]
+SendBatch = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class MicroBatcher:
+    """Agrupa peticiones que llegan dentro de una ventana de pocos ms.
+
+    Cada `submit` deja su item y espera su propio future. El lote sale
+    cuando se cumple `window` desde el primer item o cuando llega a
+    `max_size`. Si hay `send_batch` el lote va en una sola llamada; si no
+    (o si el servicio responde que no existe), se reparte en llamadas
+    individuales con a lo más `concurrency` simultáneas entre todos los
+    lotes en vuelo y las llamadas directas de `call_one`.
+    """
+
+    def __init__(
+        self,
+        send_one: SendOne,
+        send_batch: Optional[SendBatch],
+        window: float,
+        max_size: int,
+        concurrency: int,
+    ):
+        self.send_one = send_one
+        self.send_batch = send_batch
+        self.window = window
+        self.max_size = max_size
+        self.concurrency = concurrency
+        self.batches = 0
+        self.items = 0
+        self.batch_calls = 0
+        self.single_calls = 0
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        # Compartido por todos los lotes: el límite es global, no por lote
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._dispatch)
+        return await future
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Los que ya se rindieron (cancelados) no se envían
+        batch = [(item, future) for item, future in self._pending if not future.done()]
+        self._pending = []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        if self.send_batch is not None and len(batch) > 1:
+            try:
+                results = await self.send_batch([item for item, _ in batch])
+                self.batch_calls += 1
+                if len(results) != len(batch):
+                    raise HTTPException(status_code=502, detail="Moderation batch response size mismatch")
+            except HTTPException as e:
+                if e.status_code in (404, 405):
+                    logger.warning("El servicio no acepta lotes; se usan llamadas individuales")
+                    self.send_batch = None
+                    await self._fan_out(batch)
+                    return
+                self._fail(batch, e)
+                return
+            except Exception as e:
+                self._fail(batch, e)
+                return
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            return
+        await self._fan_out(batch)
+
+    async def call_one(self, item: Any) -> Any:
+        """Llamada individual sin ventana, con el mismo límite de concurrencia."""
+        async with self._semaphore:
+            return await self._send_one(item)
+
+    async def _send_one(self, item: Any) -> Any:
+        try:
+            return await self.send_one(item)
+        finally:
+            self.single_calls += 1
+
+    async def _fan_out(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        async def send(item: Any, future: asyncio.Future):
+            async with self._semaphore:
+                if future.done():
+                    return
+                try:
+                    result = await self._send_one(item)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+                if not future.done():
+                    future.set_result(result)
+
+        await asyncio.gather(*(send(item, future) for item, future in batch))
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Any, asyncio.Future]], error: Exception) -> None:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def snapshot(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_calls": self.batch_calls,
+            "single_calls": self.single_calls,
+        }
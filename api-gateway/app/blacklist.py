@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import unicodedata
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FetchPage = Callable[[int, int], Awaitable[Any]]
+
+# Orden de severidades conocidas; una palabra sin severidad (o con una
+# desconocida) queda en 0 y solo bloquea con MIN_SEVERITY="any"
+SEVERITY_RANK = {"any": 0, "low": 1, "medium": 2, "high": 3, "critical": 4}
+# Severidades que reporta el servicio en ModerateMessageResponse
+SEVERITY_NAMES = {0: "none", 1: "low", 2: "medium"}
+
+
+def severity_name(rank: int) -> str:
+    return SEVERITY_NAMES.get(rank, "high")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes, con los mismos índices para palabras y mensajes."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def severity_rank(value: Any) -> int:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    return SEVERITY_RANK.get(str(value).lower(), 0) if value is not None else 0
+
+
+def word_entries(payload: Any) -> List[Dict[str, Any]]:
+    """Extrae la lista de palabras de una respuesta de /blacklist/words."""
+    if isinstance(payload, dict):
+        for key in ("words", "items", "data", "results"):
+            if isinstance(payload.get(key), list):
+                return payload[key]
+        return [payload] if "word" in payload else []
+    return payload if isinstance(payload, list) else []
+
+
+class AhoCorasick:
+    """Autómata Aho–Corasick sobre texto normalizado.
+
+    Las altas y bajas modifican el trie en el momento; los enlaces de fallo
+    se recalculan (un recorrido BFS, sin reinsertar palabras) en el primer
+    `search` posterior. Solo se reportan coincidencias de palabra completa,
+    para no bloquear "clase" por contener otra palabra.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._terms: List[Dict[str, Any]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[Tuple[str, Any], ...]] = [()]
+        self._dirty = False
+
+    def add(self, term: str, value: Any) -> None:
+        node = 0
+        for ch in term:
+            child = self._goto[node].get(ch)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][ch] = child
+                self._goto.append({})
+                self._terms.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = child
+        self._terms[node][term] = value
+        self._dirty = True
+
+    def remove(self, term: str) -> None:
+        node = 0
+        for ch in term:
+            node = self._goto[node].get(ch)
+            if node is None:
+                return
+        if self._terms[node].pop(term, None) is not None:
+            self._dirty = True
+
+    def _build(self) -> None:
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._out[child] = tuple(self._terms[child].items())
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = tuple(self._terms[child].items()) + self._out[self._fail[child]]
+                queue.append(child)
+        self._dirty = False
+
+    def search(self, text: str) -> List[Tuple[str, Any]]:
+        if self._dirty:
+            self._build()
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        node = 0
+        last = len(text) - 1
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                after_ok = i == last or not text[i + 1].isalnum()
+                if not after_ok:
+                    continue
+                for term, value in out[node]:
+                    start = i - len(term) + 1
+                    if start == 0 or not text[start - 1].isalnum():
+                        matches.append((term, value))
+        return matches
+
+
+class BlacklistMatcher:
+    """Copia local de la blacklist del servicio de moderación.
+
+    Se sincroniza completa al iniciar y cada `sync_interval`, y se actualiza
+    en el momento con las altas/bajas que pasan por el gateway. Un mensaje
+    se bloquea localmente solo si contiene una palabra con severidad
+    >= `min_severity`; todo lo demás sigue yendo al modelo remoto.
+    """
+
+    def __init__(self, fetch_page: FetchPage, min_severity: str, sync_interval: float, page_size: int):
+        self.fetch_page = fetch_page
+        self.min_rank = severity_rank(min_severity)
+        self.sync_interval = sync_interval
+        self.page_size = page_size
+        self.synced = False
+        self.blocked = 0
+        self.forwarded = 0
+        self.sync_failures = 0
+        self._automaton = AhoCorasick()
+        self._words: Dict[str, Tuple[str, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _parse(entry: Dict[str, Any]) -> Optional[Tuple[str, str, int]]:
+        word = entry.get("word") if isinstance(entry, dict) else None
+        if not isinstance(word, str) or not normalize(word).strip():
+            return None
+        # Las desactivadas no bloquean en el servicio; los patrones regex no
+        # se evalúan aquí (esos mensajes los sigue revisando el servicio)
+        if entry.get("is_active") is False or entry.get("is_regex") is True:
+            return None
+        word_id = str(entry.get("id") or entry.get("_id") or entry.get("word_id") or word)
+        return word_id, normalize(word).strip(), severity_rank(entry.get("severity"))
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        parsed = self._parse(entry)
+        if parsed is None:
+            # Una palabra que pasó a inactiva (o a regex) deja de bloquear
+            if isinstance(entry, dict) and entry.get("id"):
+                self.remove(str(entry["id"]))
+            return
+        word_id, term, rank = parsed
+        self.remove(word_id)
+        self._words[word_id] = (term, rank)
+        self._automaton.add(term, rank)
+
+    def remove(self, word_id: str) -> None:
+        previous = self._words.pop(str(word_id), None)
+        if previous is None:
+            return
+        term = previous[0]
+        self._automaton.remove(term)
+        # Otra entrada con la misma palabra sigue vigente
+        for other_term, rank in self._words.values():
+            if other_term == term:
+                self._automaton.add(term, rank)
+                break
+
+    def replace(self, entries: List[Dict[str, Any]]) -> None:
+        words: Dict[str, Tuple[str, int]] = {}
+        automaton = AhoCorasick()
+        for entry in entries:
+            parsed = self._parse(entry)
+            if parsed is not None:
+                words[parsed[0]] = parsed[1:]
+        for term, rank in words.values():
+            automaton.add(term, rank)
+        self._words, self._automaton = words, automaton
+        self.synced = True
+
+    def blocking_words(self, content: str) -> List[Tuple[str, int]]:
+        """(palabra, severidad) bloqueantes en `content` (vacío si hay que consultar al modelo)."""
+        if not self.synced or not content:
+            return []
+        found: Dict[str, int] = {}
+        for term, rank in self._automaton.search(normalize(content)):
+            if rank >= self.min_rank:
+                found.setdefault(term, rank)
+        return list(found.items())
+
+    async def sync(self) -> None:
+        entries: List[Dict[str, Any]] = []
+        skip = 0
+        while True:
+            page = word_entries(await self.fetch_page(self.page_size, skip))
+            entries.extend(page)
+            if len(page) < self.page_size:
+                break
+            skip += self.page_size
+        self.replace(entries)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception:
+                # Se mantiene la última copia; sin copia todo se consulta al modelo
+                self.sync_failures += 1
+                logger.warning("No se pudo sincronizar la blacklist de moderación", exc_info=True)
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "synced": self.synced,
+            "words": len(self._words),
+            "blocked": self.blocked,
+            "forwarded": self.forwarded,
+            "sync_failures": self.sync_failures,
+        }
@@ -0,0 +1,147 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from .config import settings
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Cache LRU acotado en entradas con expiración por TTL.
+
+    El gateway corre en un único event loop, así que no necesita locks.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING or item[0] <= time.monotonic():
+            if item is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class ResponseCache:
+    """Cache de respuestas GET de los microservicios con stale-while-revalidate.
+
+    Claves: (servicio, path, params, sujeto). Cada entrada es fresca durante
+    su TTL y luego "stale" por `stale_seconds` más: en ese periodo se sirve
+    la copia vieja y se refresca en segundo plano. Las rutas que modifican
+    un recurso invalidan por (servicio, path), sin importar params ni sujeto.
+    Los valores se comparten entre peticiones: no se deben mutar.
+    """
+
+    FRESH = "fresh"
+    STALE = "stale"
+
+    def __init__(self, maxsize: int, stale_seconds: float):
+        self.maxsize = maxsize
+        self.stale_seconds = stale_seconds
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[tuple, Tuple[float, float, Any]]" = OrderedDict()
+        self._by_path: Dict[Tuple[str, str], Set[tuple]] = {}
+        self._generations: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._generation_counter = 0
+
+    @staticmethod
+    def make_key(service: str, path: str, params: Optional[Dict[str, Any]], subject: str) -> tuple:
+        items = tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+        return (service, path, items, subject)
+
+    def lookup(self, key: tuple) -> Tuple[Optional[str], Any]:
+        item = self._data.get(key)
+        now = time.monotonic()
+        if item is None or item[1] <= now:
+            if item is not None:
+                self._remove(key)
+            self.misses += 1
+            return None, None
+        self._data.move_to_end(key)
+        if item[0] > now:
+            self.hits += 1
+            return self.FRESH, item[2]
+        self.stale_hits += 1
+        return self.STALE, item[2]
+
+    def generation(self, key: tuple) -> int:
+        return self._generations.get(key[:2], 0)
+
+    def store(self, key: tuple, value: Any, ttl: float, generation: int) -> None:
+        # Si hubo una invalidación mientras se pedía la respuesta, se descarta
+        if self.generation(key) != generation:
+            return
+        now = time.monotonic()
+        self._data[key] = (now + ttl, now + ttl + self.stale_seconds, value)
+        self._data.move_to_end(key)
+        self._by_path.setdefault(key[:2], set()).add(key)
+        while len(self._data) > self.maxsize:
+            oldest, _ = next(iter(self._data.items()))
+            self._remove(oldest)
+
+    def invalidate(self, service: str, path: str) -> None:
+        path_key = (service, path)
+        self._generation_counter += 1
+        self._generations[path_key] = self._generation_counter
+        self._generations.move_to_end(path_key)
+        while len(self._generations) > self.maxsize:
+            self._generations.popitem(last=False)
+        for key in self._by_path.pop(path_key, set()):
+            self._data.pop(key, None)
+
+    def _remove(self, key: tuple) -> None:
+        self._data.pop(key, None)
+        keys = self._by_path.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_path[key[:2]]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._by_path.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+
+response_cache = ResponseCache(
+    settings.RESPONSE_CACHE_MAX_ENTRIES,
+    settings.RESPONSE_CACHE_STALE_SECONDS,
+)
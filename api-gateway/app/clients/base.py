@@ -1,15 +1,139 @@
+import asyncio
+import hashlib
+import time
 import httpx
 from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from typing import Dict, Any, Optional
 from ..config import settings
+from ..cache import response_cache
+from .breaker import AdaptiveTimeout, CircuitBreaker
+
+# Headers de la respuesta del microservicio que se reenvían en modo streaming
+PASSTHROUGH_HEADERS = {
+    "content-type",
+    "content-length",
+    "content-encoding",
+    "content-disposition",
+    "cache-control",
+    "etag",
+    "last-modified",
+}
+
+# Referencias a los refrescos en segundo plano (stale-while-revalidate)
+_background_refreshes = set()
 
 class ServiceClient:
     """Cliente base para comunicación con microservicios"""
     
-    def __init__(self, base_url: str):
+    def __init__(
+        self,
+        base_url: str,
+        name: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        read_timeout: Optional[float] = None,
+    ):
         self.base_url = base_url
-        # Deshabilitar verificación SSL para servicios con certificados auto-firmados
-        self.client = httpx.AsyncClient(timeout=30.0, verify=False)
+        self.name = name or base_url
+        max_connections = max_connections or settings.HTTP_MAX_CONNECTIONS_PER_SERVICE.get(
+            self.name, settings.HTTP_MAX_CONNECTIONS
+        )
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(settings.HTTP_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        # Timeouts separados: un servicio caído falla rápido en connect/pool
+        # en vez de esperar el timeout de lectura completo.
+        self.timeout = httpx.Timeout(
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            read=read_timeout or settings.HTTP_READ_TIMEOUT_PER_SERVICE.get(
+                self.name, settings.HTTP_READ_TIMEOUT
+            ),
+            write=settings.HTTP_WRITE_TIMEOUT,
+            pool=settings.HTTP_POOL_TIMEOUT,
+        )
+        self.breaker = CircuitBreaker(
+            window_size=settings.BREAKER_WINDOW_SIZE,
+            min_calls=settings.BREAKER_MIN_CALLS,
+            failure_rate=settings.BREAKER_FAILURE_RATE,
+            open_seconds=settings.BREAKER_OPEN_SECONDS,
+            half_open_max_calls=settings.BREAKER_HALF_OPEN_MAX_CALLS,
+        )
+        self.adaptive_timeout = AdaptiveTimeout(
+            maximum=self.timeout.read,
+            minimum=settings.ADAPTIVE_TIMEOUT_MIN,
+            percentile=settings.ADAPTIVE_TIMEOUT_PERCENTILE,
+            multiplier=settings.ADAPTIVE_TIMEOUT_MULTIPLIER,
+            min_samples=settings.ADAPTIVE_TIMEOUT_MIN_SAMPLES,
+        )
+        self._refreshing = set()
+        self._inflight = {}
+        self.coalesced = 0
+        self.client = self._build_client()
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # Deshabilitar verificación SSL para servicios con certificados auto-firmados.
+        # HTTP/2 se negocia por ALPN sólo en servicios https; el resto sigue en HTTP/1.1.
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=settings.HTTP2_ENABLED,
+            verify=False,
+        )
+
+    async def open(self):
+        """Reabre el pool de conexiones si se cerró (p.ej. tras un shutdown)."""
+        if self.client.is_closed:
+            self.client = self._build_client()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def _request_timeout(self) -> httpx.Timeout:
+        if not settings.ADAPTIVE_TIMEOUT_ENABLED:
+            return self.timeout
+        return httpx.Timeout(
+            connect=self.timeout.connect,
+            read=self.adaptive_timeout.current(),
+            write=self.timeout.write,
+            pool=self.timeout.pool,
+        )
+
+    def _reject_open_circuit(self):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Service unavailable: circuit open for {self.name}",
+            headers={"Retry-After": str(self.breaker.retry_after())},
+        )
+
+    def health(self) -> dict:
+        return {
+            **self.breaker.snapshot(),
+            **self.adaptive_timeout.snapshot(),
+            "coalesced_requests": self.coalesced,
+        }
+    
+    def _record_outcome(self, response: httpx.Response, started: float):
+        # Los 5xx cuentan como fallo del servicio; los 4xx son errores del cliente
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+            self.adaptive_timeout.observe(time.monotonic() - started)
+    
+    @staticmethod
+    def _raise_for_error(response: httpx.Response):
+        try:
+            error_detail = response.json()
+        except:
+            error_detail = {"detail": response.text}
+        
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=error_detail
+        )
     
     async def _request(
         self,
@@ -19,10 +143,17 @@ class ServiceClient:
         json: Optional[Dict[str, Any]] = None,
         params: Optional[Dict[str, Any]] = None,
         data: Optional[Any] = None,
+        content: Optional[Any] = None,
+        adaptive_timeout: bool = True,
     ) -> Dict[str, Any]:
         """Realiza una petición HTTP al microservicio"""
         url = f"{self.base_url}{path}"
         
+        # Con el circuito abierto se responde 503 sin esperar al servicio caído
+        if not self.breaker.allow_request():
+            self._reject_open_circuit()
+        
+        started = time.monotonic()
         try:
             response = await self.client.request(
                 method=method,
@@ -31,34 +162,203 @@ class ServiceClient:
                 json=json,
                 params=params,
                 data=data,
+                content=content,
+                timeout=self._request_timeout() if adaptive_timeout else self.timeout,
             )
             
+            self._record_outcome(response, started)
+            
             # Si la respuesta no es exitosa, propagar el error
             if response.status_code >= 400:
-                try:
-                    error_detail = response.json()
-                except:
-                    error_detail = {"detail": response.text}
-                
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=error_detail
-                )
+                self._raise_for_error(response)
             
             return response.json()
             
         except httpx.RequestError as e:
+            self.breaker.record_failure()
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail=f"Service unavailable: {str(e)}"
             )
     
-    async def get(self, path: str, headers: Optional[Dict] = None, params: Optional[Dict] = None):
-        return await self._request("GET", path, headers=headers, params=params)
+    async def stream(
+        self,
+        method: str,
+        path: str,
+        headers: Optional[Dict[str, str]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+    ) -> Response:
+        """Reenvía la respuesta del microservicio tal cual, sin decodificar el JSON.
+
+        Los bytes, el status y los headers de `PASSTHROUGH_HEADERS` pasan
+        directo al cliente. Los errores (>= 400) se leen completos y se
+        propagan como HTTPException, igual que en `_request`.
+        """
+        if not settings.STREAMING_PASSTHROUGH_ENABLED:
+            return JSONResponse(
+                await self._request(method, path, headers=headers, json=json, params=params)
+            )
+        return await self._send_streaming(
+            method, f"{self.base_url}{path}", headers, params, json, self._request_timeout()
+        )
+    
+    async def stream_url(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        """GET en streaming a una URL absoluta (p.ej. una URL pre-firmada de descarga)."""
+        return await self._send_streaming("GET", url, headers, None, None, self.timeout)
+    
+    async def _send_streaming(self, method, url, headers, params, json, timeout) -> Response:
+        if not self.breaker.allow_request():
+            self._reject_open_circuit()
+        
+        # Sin compresión entre gateway y servicio: los bytes se reenvían sin tocar
+        headers = {"Accept-Encoding": "identity", **(headers or {})}
+        request = self.client.build_request(
+            method,
+            url,
+            headers=headers,
+            params=params,
+            json=json,
+            timeout=timeout,
+        )
+        started = time.monotonic()
+        try:
+            response = await self.client.send(request, stream=True)
+        except httpx.RequestError as e:
+            self.breaker.record_failure()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Service unavailable: {str(e)}"
+            )
+        self._record_outcome(response, started)
+        
+        if response.status_code >= 400:
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            self._raise_for_error(response)
+        
+        forwarded = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() in PASSTHROUGH_HEADERS
+        }
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers=forwarded,
+            background=BackgroundTask(response.aclose),
+        )
+    
+    async def get(
+        self,
+        path: str,
+        headers: Optional[Dict] = None,
+        params: Optional[Dict] = None,
+        cache_ttl: Optional[float] = None,
+        cache_subject: Optional[str] = None,
+    ):
+        """GET al microservicio; con `cache_ttl` la respuesta se cachea.
+
+        `cache_subject` separa las entradas por usuario (p.ej. el `sub` del
+        JWT); si no se indica se usa un hash del header Authorization.
+        """
+        if not cache_ttl or not settings.RESPONSE_CACHE_ENABLED:
+            return await self._get_once(path, headers, params)
+        
+        key = response_cache.make_key(self.name, path, params, self._cache_subject(headers, cache_subject))
+        state, value = response_cache.lookup(key)
+        if state == response_cache.FRESH:
+            return value
+        if state == response_cache.STALE:
+            self._schedule_refresh(key, path, headers, params, cache_ttl)
+            return value
+        return await self._fetch_and_store(key, path, headers, params, cache_ttl)
+    
+    async def _get_once(self, path, headers, params):
+        """Singleflight: GETs idénticos concurrentes comparten una sola llamada.
+
+        La llamada corre en su propia tarea, así que si el primer solicitante
+        se cancela el resto de los que esperan igual recibe la respuesta.
+        """
+        if not settings.SINGLEFLIGHT_ENABLED:
+            return await self._request("GET", path, headers=headers, params=params)
+        
+        key = (
+            path,
+            tuple(sorted((k, str(v)) for k, v in (params or {}).items())),
+            tuple(sorted((headers or {}).items())),
+        )
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._request("GET", path, headers=headers, params=params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget_inflight(key, t))
+        return await asyncio.shield(task)
+    
+    def _forget_inflight(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marca la excepción como leída aunque todos los solicitantes se hayan ido
+        if not task.cancelled():
+            task.exception()
+    
+    @staticmethod
+    def _cache_subject(headers: Optional[Dict], subject: Optional[str]) -> str:
+        if subject is not None:
+            return subject
+        authorization = (headers or {}).get("Authorization")
+        if not authorization:
+            return ""
+        return hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+    
+    async def _fetch_and_store(self, key, path, headers, params, ttl):
+        generation = response_cache.generation(key)
+        value = await self._get_once(path, headers, params)
+        response_cache.store(key, value, ttl, generation)
+        return value
+    
+    def _schedule_refresh(self, key, path, headers, params, ttl):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        
+        async def refresh():
+            try:
+                await self._fetch_and_store(key, path, headers, params, ttl)
+            except Exception:
+                # Se sigue sirviendo la copia stale hasta que expire del todo
+                pass
+            finally:
+                self._refreshing.discard(key)
+        
+        task = asyncio.create_task(refresh())
+        _background_refreshes.add(task)
+        task.add_done_callback(_background_refreshes.discard)
+    
+    def invalidate(self, *paths: str):
+        """Invalida las respuestas cacheadas de estos paths (todas las variantes)."""
+        for path in paths:
+            response_cache.invalidate(self.name, path)
     
     async def post(self, path: str, json: Dict, headers: Optional[Dict] = None):
         return await self._request("POST", path, headers=headers, json=json)
     
+    async def post_stream(
+        self,
+        path: str,
+        content: Any,
+        headers: Optional[Dict] = None,
+        params: Optional[Dict] = None
+    ):
+        """POST con el body como iterable de bytes (no se carga completo en memoria)"""
+        return await self._request(
+            "POST", path, headers=headers, params=params, content=content, adaptive_timeout=False
+        )
+    
     async def put(self, path: str, json: Dict, headers: Optional[Dict] = None):
         return await self._request("PUT", path, headers=headers, json=json)
     
@@ -70,14 +370,43 @@ class ServiceClient:
 
 
 # Instancias de clientes para cada microservicio
-users_client = ServiceClient(settings.USERS_SERVICE_URL)
-channel_client = ServiceClient(settings.CHANNEL_SERVICE_URL)
-messages_client = ServiceClient(settings.MESSAGES_SERVICE_URL)
-files_client = ServiceClient(settings.FILES_SERVICE_URL)
-moderation_client = ServiceClient(settings.MODERATION_SERVICE_URL)
-presence_client = ServiceClient(settings.PRESENCE_SERVICE_URL)
-search_client = ServiceClient(settings.SEARCH_SERVICE_URL)
-wikipedia_client = ServiceClient(settings.WIKIPEDIA_SERVICE_URL)
-chatbot_prog_client = ServiceClient(settings.CHATBOT_PROG_SERVICE_URL)
-threads_client = ServiceClient(settings.THREADS_SERVICE_URL)
-files_client = ServiceClient(settings.FILES_SERVICE_URL)
+users_client = ServiceClient(settings.USERS_SERVICE_URL, name="users")
+channel_client = ServiceClient(settings.CHANNEL_SERVICE_URL, name="channels")
+messages_client = ServiceClient(settings.MESSAGES_SERVICE_URL, name="messages")
+files_client = ServiceClient(settings.FILES_SERVICE_URL, name="files")
+moderation_client = ServiceClient(settings.MODERATION_SERVICE_URL, name="moderation")
+presence_client = ServiceClient(settings.PRESENCE_SERVICE_URL, name="presence")
+search_client = ServiceClient(settings.SEARCH_SERVICE_URL, name="search")
+wikipedia_client = ServiceClient(settings.WIKIPEDIA_SERVICE_URL, name="wikipedia")
+chatbot_prog_client = ServiceClient(settings.CHATBOT_PROG_SERVICE_URL, name="chatbot_prog")
+threads_client = ServiceClient(settings.THREADS_SERVICE_URL, name="threads")
+
+SERVICE_CLIENTS = {
+    client.name: client
+    for client in (
+        users_client,
+        channel_client,
+        messages_client,
+        files_client,
+        moderation_client,
+        presence_client,
+        search_client,
+        wikipedia_client,
+        chatbot_prog_client,
+        threads_client,
+    )
+}
+
+
+async def open_clients():
+    for client in SERVICE_CLIENTS.values():
+        await client.open()
+
+
+def clients_health() -> Dict[str, dict]:
+    return {name: client.health() for name, client in SERVICE_CLIENTS.items()}
+
+
+async def close_clients():
+    for client in SERVICE_CLIENTS.values():
+        await client.aclose()
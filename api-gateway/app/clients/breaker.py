@@ -0,0 +1,147 @@
+import time
+from collections import deque
+from typing import Deque, Optional
+
+
+class CircuitBreaker:
+    """Circuit breaker por microservicio (closed / open / half-open).
+
+    Lleva una ventana con el resultado de las últimas llamadas. Si la tasa
+    de fallos supera el umbral (con un mínimo de llamadas) el circuito se
+    abre y las peticiones se rechazan sin tocar la red durante
+    `open_seconds`. Pasado ese tiempo se deja pasar un número limitado de
+    llamadas de prueba (half-open): si salen bien se cierra, si fallan se
+    vuelve a abrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window_size: int,
+        min_calls: int,
+        failure_rate: float,
+        open_seconds: float,
+        half_open_max_calls: int,
+    ):
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.rejected = 0
+        self._results: Deque[bool] = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    def allow_request(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self._half_open()
+        if self.state == self.HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                # Una prueba que nunca reportó resultado (p.ej. cancelada) no
+                # debe dejar el circuito bloqueado para siempre
+                if time.monotonic() - self._opened_at >= 2 * self.open_seconds:
+                    self._half_open()
+                    self._half_open_calls += 1
+                    return True
+                self.rejected += 1
+                return False
+            self._half_open_calls += 1
+        return True
+
+    def retry_after(self) -> int:
+        remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def record_success(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._close()
+            return
+        self._results.append(True)
+
+    def record_failure(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self._results.append(False)
+        calls = len(self._results)
+        if calls >= self.min_calls and self._results.count(False) / calls >= self.failure_rate:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._results.clear()
+
+    def _half_open(self) -> None:
+        self.state = self.HALF_OPEN
+        self._half_open_calls = 0
+
+    def _close(self) -> None:
+        self.state = self.CLOSED
+        self._results.clear()
+
+    def snapshot(self) -> dict:
+        calls = len(self._results)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "failure_rate": round(self._results.count(False) / calls, 3) if calls else 0.0,
+            "rejected": self.rejected,
+        }
+
+
+class AdaptiveTimeout:
+    """Timeout de lectura derivado de la latencia observada.
+
+    Guarda las latencias de las últimas respuestas exitosas y propone
+    `percentil * multiplier`, acotado entre `minimum` y `maximum` (el
+    timeout configurado). Hasta reunir `min_samples` se usa el máximo.
+    """
+
+    def __init__(
+        self,
+        maximum: float,
+        minimum: float,
+        percentile: float,
+        multiplier: float,
+        min_samples: int,
+        sample_size: int = 200,
+    ):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=sample_size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def latency_percentile(self) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return ordered[index]
+
+    def current(self) -> float:
+        observed = self.latency_percentile()
+        if observed is None:
+            return self.maximum
+        return min(self.maximum, max(self.minimum, observed * self.multiplier))
+
+    def snapshot(self) -> dict:
+        observed = self.latency_percentile()
+        return {
+            "read_timeout": round(self.current(), 3),
+            "latency_percentile": round(observed, 4) if observed is not None else None,
+            "samples": len(self._samples),
+        }
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Literal, Optional
 
 class Settings(BaseSettings):
     # App settings
@@ -10,6 +10,9 @@ class Settings(BaseSettings):
     # JWT Settings (heredados del users-service)
     JWT_SECRET: str = "your-secret-key-change-in-production"
     JWT_ALG: str = "HS256"
+    # Cache de tokens ya verificados (nunca más allá de su exp)
+    JWT_CACHE_MAX_ENTRIES: int = 10000
+    JWT_CACHE_TTL_SECONDS: float = 300.0
     
     # Microservices URLs - External services (otros grupos)
     # Grupo 1 (propio)
@@ -26,6 +29,96 @@ class Settings(BaseSettings):
     CHATBOT_PROG_SERVICE_URL: str = "https://chatbotprogra.inf326.nursoft.dev"
     THREADS_SERVICE_URL: str = "http://threads-service.default.svc.cluster.local"
     FILES_SERVICE_URL: str = "http://file-service-api.file-service.svc.cluster.local:80"
+
+    # Pool HTTP hacia los microservicios (uno por servicio)
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 30.0
+    HTTP_WRITE_TIMEOUT: float = 30.0
+    HTTP_POOL_TIMEOUT: float = 5.0
+    # Overrides por servicio en JSON, p.ej. '{"presence": 200}' / '{"wikipedia": 10}'
+    HTTP_MAX_CONNECTIONS_PER_SERVICE: Dict[str, int] = {}
+    HTTP_READ_TIMEOUT_PER_SERVICE: Dict[str, float] = {}
+
+    # Circuit breaker por microservicio
+    BREAKER_WINDOW_SIZE: int = 50
+    BREAKER_MIN_CALLS: int = 10
+    BREAKER_FAILURE_RATE: float = 0.5
+    BREAKER_OPEN_SECONDS: float = 30.0
+    BREAKER_HALF_OPEN_MAX_CALLS: int = 1
+
+    # Timeout de lectura adaptativo (percentil de latencia * multiplicador)
+    ADAPTIVE_TIMEOUT_ENABLED: bool = True
+    ADAPTIVE_TIMEOUT_MIN: float = 2.0
+    ADAPTIVE_TIMEOUT_PERCENTILE: float = 0.99
+    ADAPTIVE_TIMEOUT_MULTIPLIER: float = 3.0
+    ADAPTIVE_TIMEOUT_MIN_SAMPLES: int = 20
+
+    # Rutas pass-through reenvían los bytes del servicio sin decodificar el JSON
+    STREAMING_PASSTHROUGH_ENABLED: bool = True
+
+    # Validación del canal al crear threads: cache | optimistic | strict
+    THREAD_CHANNEL_CHECK: Literal["cache", "optimistic", "strict"] = "cache"
+    CHANNEL_STATUS_TTL_SECONDS: float = 30.0
+    CHANNEL_STATUS_CACHE_MAX_ENTRIES: int = 10000
+
+    # Presencia en lote (POST /presence/batch y overview de canal)
+    PRESENCE_BATCH_MAX: int = 500
+    PRESENCE_BATCH_CONCURRENCY: int = 10
+    PRESENCE_BATCH_LIST_THRESHOLD: int = 50
+    PRESENCE_CACHE_TTL_SECONDS: float = 5.0
+    PRESENCE_CACHE_MAX_ENTRIES: int = 10000
+
+    # Heartbeats de presencia absorbidos y enviados en lotes periódicos
+    HEARTBEAT_COALESCING_ENABLED: bool = True
+    HEARTBEAT_FLUSH_INTERVAL: float = 5.0
+    HEARTBEAT_FLUSH_CONCURRENCY: int = 20
+
+    # Cache de URLs pre-firmadas de descarga (por file_id) y de acceso por usuario
+    PRESIGN_CACHE_MAX_ENTRIES: int = 10000
+    PRESIGN_DEFAULT_TTL_SECONDS: float = 60.0
+    PRESIGN_MAX_TTL_SECONDS: float = 3600.0
+    PRESIGN_EXPIRY_MARGIN_SECONDS: float = 30.0
+    FILE_ACCESS_TTL_SECONDS: float = 60.0
+    PRESIGN_BATCH_MAX: int = 100
+    PRESIGN_BATCH_CONCURRENCY: int = 10
+
+    # Pre-filtro de moderación: blacklist local (Aho–Corasick) antes del modelo
+    MODERATION_PREFILTER_ENABLED: bool = True
+    MODERATION_PREFILTER_MIN_SEVERITY: str = "high"
+    # Reenviar los bloqueos locales a /check en segundo plano para registrar strikes
+    MODERATION_PREFILTER_REPORT_HITS: bool = True
+    MODERATION_BLACKLIST_SYNC_SECONDS: float = 300.0
+    MODERATION_BLACKLIST_PAGE_SIZE: int = 100
+
+    # Cache de veredictos de moderación aprobados (por hash del contenido)
+    MODERATION_VERDICT_CACHE_ENABLED: bool = True
+    MODERATION_VERDICT_CACHE_MAX_ENTRIES: int = 20000
+    MODERATION_VERDICT_CACHE_TTL_SECONDS: float = 600.0
+    # Cuánto se confía en que un (usuario, canal) sigue sin strikes
+    MODERATION_CLEAN_USER_TTL_SECONDS: float = 60.0
+
+    # Micro-batching de /moderation/check (ventana en segundos)
+    MODERATION_BATCHING_ENABLED: bool = True
+    MODERATION_BATCH_WINDOW_SECONDS: float = 0.005
+    MODERATION_BATCH_MAX_SIZE: int = 32
+    MODERATION_BATCH_CONCURRENCY: int = 16
+    MODERATION_BATCH_ENDPOINT: Optional[str] = None
+
+    # Coalescing de GETs idénticos en vuelo (singleflight)
+    SINGLEFLIGHT_ENABLED: bool = True
+
+    # Cache de respuestas GET (opt-in por ruta) con stale-while-revalidate
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 5000
+    RESPONSE_CACHE_STALE_SECONDS: float = 30.0
+    CACHE_TTL_CHANNEL: float = 30.0
+    CACHE_TTL_CHANNEL_MEMBERS: float = 15.0
+    CACHE_TTL_BLACKLIST: float = 60.0
+    CACHE_TTL_PRESENCE_STATS: float = 5.0
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+SendUpdate = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+
+class HeartbeatBuffer:
+    """Tabla en memoria de heartbeats/status pendientes de enviar a presence.
+
+    Cada PATCH se absorbe aquí (un registro por usuario, con el último
+    status) y una tarea periódica los envía en bloque con concurrencia
+    acotada. Así N heartbeats de un usuario dentro del intervalo se
+    convierten en una sola llamada al microservicio.
+    """
+
+    def __init__(self, send: SendUpdate, interval: float, concurrency: int):
+        self.send = send
+        self.interval = interval
+        self.concurrency = concurrency
+        self.absorbed = 0
+        self.sent = 0
+        self.failures = 0
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def absorb(self, user_id: str, update: Dict[str, Any]) -> None:
+        # Sólo un status real o heartbeat=true; lo demás no se debe inventar
+        if update.get("status") is None and update.get("heartbeat") is not True:
+            return
+        entry = self._pending.setdefault(user_id, {"status": None, "heartbeat": False})
+        if update.get("status") is not None:
+            entry["status"] = update["status"]
+        if update.get("heartbeat") is True:
+            entry["heartbeat"] = True
+        self.absorbed += 1
+
+    def discard(self, user_id: str) -> None:
+        self._pending.pop(user_id, None)
+
+    def pending_status(self, user_id: str) -> Optional[str]:
+        entry = self._pending.get(user_id)
+        return entry["status"] if entry else None
+
+    @staticmethod
+    def _payload(entry: Dict[str, Any]) -> Dict[str, Any]:
+        # El servicio no acepta status y heartbeat juntos; un cambio de
+        # status ya cuenta como señal de vida
+        if entry["status"] is not None:
+            return {"status": entry["status"]}
+        return {"heartbeat": True}
+
+    async def flush(self) -> int:
+        """Envía lo pendiente; retorna cuántas llamadas se hicieron."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_one(user_id: str, entry: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    await self.send(user_id, self._payload(entry))
+                    self.sent += 1
+                except Exception as e:
+                    self.failures += 1
+                    # Un status que no llegó por falla del servicio se reintenta,
+                    # salvo que ya haya uno más nuevo; los 4xx se descartan
+                    retryable = not isinstance(e, HTTPException) or e.status_code >= 500
+                    if retryable and entry["status"] is not None:
+                        newer = self._pending.setdefault(user_id, {"status": None, "heartbeat": False})
+                        if newer["status"] is None:
+                            newer["status"] = entry["status"]
+
+        await asyncio.gather(*(send_one(user_id, entry) for user_id, entry in batch.items()))
+        return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.warning("No se pudieron enviar los heartbeats de presencia", exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Lo pendiente se envía antes de apagar
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "pending_users": len(self._pending),
+            "absorbed": self.absorbed,
+            "sent": self.sent,
+            "failures": self.failures,
+        }
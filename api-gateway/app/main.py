@@ -1,12 +1,31 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
+from .cache import response_cache
+from .clients.base import open_clients, close_clients, clients_health
 from .routes import users, moderation, presence, search, messages, files, channels, chatbots
 import os
 
 # root_path para que funcione detrás de un path prefix en Ingress
 root_path = os.getenv("ROOT_PATH", "")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Los pools de conexión viven lo que vive el proceso: se abren al iniciar
+    # y se cierran ordenadamente al apagar.
+    await open_clients()
+    if settings.HEARTBEAT_COALESCING_ENABLED:
+        presence.heartbeats.start()
+    if settings.MODERATION_PREFILTER_ENABLED:
+        moderation.blacklist.start()
+    yield
+    await moderation.blacklist.stop()
+    await presence.heartbeats.stop()
+    await close_clients()
+
+
 app = FastAPI(
     title="Student Messaging API Gateway - Grupo 1",
     version=settings.APP_VERSION,
@@ -109,6 +128,7 @@ Este gateway se comunica con los siguientes microservicios:
 - **Programming Bot:** https://chatbotprogra.inf326.nursoft.dev
     """,
     root_path=root_path,
+    lifespan=lifespan,
 )
 
 # CORS Configuration
@@ -127,7 +147,14 @@ def health():
         "status": "ok",
         "service": settings.APP_NAME,
         "version": settings.APP_VERSION,
-        "environment": settings.ENV
+        "environment": settings.ENV,
+        # Estado del circuit breaker y timeout adaptativo de cada microservicio
+        "downstreams": clients_health(),
+        "response_cache": response_cache.snapshot(),
+        "heartbeats": presence.heartbeats.snapshot(),
+        "moderation_prefilter": moderation.blacklist.snapshot(),
+        "moderation_verdicts": moderation.verdicts.snapshot(),
+        "moderation_batching": moderation.check_batcher.snapshot(),
     }
 
 @app.get("/", tags=["Gateway"])
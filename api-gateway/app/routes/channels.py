@@ -1,18 +1,44 @@
+import asyncio
 from fastapi import APIRouter, Depends, Header, HTTPException
-from fastapi.security import HTTPAuthorizationCredentials
-from typing import Dict, Any
+from typing import Dict, Any, List
 from ..clients.base import channel_client, threads_client
-from ..auth import get_current_user, security
+from ..auth import AuthContext, get_auth
+from ..cache import TTLCache
+from ..config import settings
+from .presence import get_presence_many
 
 router = APIRouter(prefix="/channels", tags=["Channels"])
 
+# channel_id -> is_active, para validar la creación de threads sin otro GET
+_channel_status = TTLCache(settings.CHANNEL_STATUS_CACHE_MAX_ENTRIES, settings.CHANNEL_STATUS_TTL_SECONDS)
+
+
+def _remember_channel(channel_id: str, channel: Any) -> Any:
+    if isinstance(channel, dict) and "is_active" in channel:
+        _channel_status.set(channel_id, bool(channel["is_active"]))
+    return channel
+
+
+def _invalidate_channel(channel_id: str):
+    """Descarta las respuestas cacheadas del canal tras modificarlo"""
+    _channel_status.invalidate(channel_id)
+    channel_client.invalidate(
+        f"/v1/channels/{channel_id}",
+        f"/v1/channels/{channel_id}/basic",
+    )
+
+
+def _invalidate_members(channel_id: Any):
+    if channel_id:
+        channel_client.invalidate(f"/v1/members/channel/{channel_id}")
+
+
 # ========== CHANNELS ==========
 
 @router.post("/")
 async def create_channel(
     channel_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Crear un nuevo canal
@@ -25,39 +51,42 @@ async def create_channel(
     return await channel_client.post(
         "/v1/channels/",
         json=channel_data,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/{channel_id}")
 async def get_channel(
     channel_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener información de un canal"""
-    return await channel_client.get(
+    channel = await channel_client.get(
         f"/v1/channels/{channel_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"},
+        cache_ttl=settings.CACHE_TTL_CHANNEL,
+        cache_subject=auth.claims.get("sub")
     )
+    return _remember_channel(channel_id, channel)
 
 @router.get("/{channel_id}/basic")
 async def get_channel_basic(
     channel_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener información básica de un canal"""
-    return await channel_client.get(
+    channel = await channel_client.get(
         f"/v1/channels/{channel_id}/basic",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"},
+        cache_ttl=settings.CACHE_TTL_CHANNEL,
+        cache_subject=auth.claims.get("sub")
     )
+    return _remember_channel(channel_id, channel)
 
 @router.put("/{channel_id}")
 async def update_channel(
     channel_id: str,
     channel_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Actualizar un canal
@@ -66,44 +95,47 @@ async def update_channel(
         "description": "nueva descripción"
     }
     """
-    return await channel_client.put(
+    result = await channel_client.put(
         f"/v1/channels/{channel_id}",
         json=channel_data,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
+    _invalidate_channel(channel_id)
+    return result
 
 @router.delete("/{channel_id}")
 async def delete_channel(
     channel_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Eliminar (desactivar) un canal"""
-    return await channel_client.delete(
+    result = await channel_client.delete(
         f"/v1/channels/{channel_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
+    _invalidate_channel(channel_id)
+    return result
 
 @router.post("/{channel_id}/reactivate")
 async def reactivate_channel(
     channel_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Reactivar un canal eliminado"""
-    return await channel_client.post(
+    result = await channel_client.post(
         f"/v1/channels/{channel_id}/reactivate",
         json={},
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
+    _invalidate_channel(channel_id)
+    return result
 
 # ========== MEMBERS ==========
 
 @router.post("/members")
 async def add_member(
     member_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Agregar miembro a un canal
@@ -113,17 +145,18 @@ async def add_member(
         "role": "member|admin"
     }
     """
-    return await channel_client.post(
+    result = await channel_client.post(
         "/v1/members/",
         json=member_data,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
+    _invalidate_members(member_data.get("channel_id"))
+    return result
 
 @router.delete("/members")
 async def remove_member(
     member_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Remover miembro de un canal
@@ -132,45 +165,46 @@ async def remove_member(
         "channel_id": "channel-id"
     }
     """
-    return await channel_client.delete(
+    result = await channel_client.delete(
         "/v1/members/",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
+    _invalidate_members(member_data.get("channel_id"))
+    return result
 
 @router.get("/members/user/{user_id}")
 async def get_user_channels(
     user_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener todos los canales de un usuario"""
     return await channel_client.get(
         f"/v1/members/{user_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/members/owner/{owner_id}")
 async def get_owned_channels(
     owner_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener canales donde el usuario es owner"""
     return await channel_client.get(
         f"/v1/members/owner/{owner_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/{channel_id}/members")
 async def get_channel_members(
     channel_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener todos los miembros de un canal"""
     return await channel_client.get(
         f"/v1/members/channel/{channel_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"},
+        cache_ttl=settings.CACHE_TTL_CHANNEL_MEMBERS,
+        cache_subject=auth.claims.get("sub")
     )
 
 # ========== THREADS ==========
@@ -178,8 +212,7 @@ async def get_channel_members(
 @router.post("/threads")
 async def create_thread(
     thread_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Crear un nuevo thread en un canal
@@ -191,47 +224,84 @@ async def create_thread(
     }
     """
     channel_id = str(thread_data.get("channel_id"))
-    
-    # Validar que el canal existe en el servicio de channels
-    try:
-        channel = await channel_client.get(
-            f"/v1/channels/{channel_id}",
-            headers={"Authorization": f"Bearer {token_creds.credentials}"}
-        )
-        # Verificar que el canal está activo
-        if not channel.get("is_active", True):
-            raise HTTPException(
-                status_code=400,
-                detail="Channel is not active"
-            )
-    except HTTPException as e:
-        if e.status_code == 404:
-            raise HTTPException(
-                status_code=404,
-                detail="Channel not found"
-            )
-        raise
+    headers = {"Authorization": f"Bearer {auth.token}"}
     
     # Adaptar el body para el threads-service
     # El threads-service espera: channel_id, title, created_by
     payload = {
         "channel_id": channel_id,
         "title": thread_data.get("title"),
-        "created_by": str(thread_data.get("author_id", current_user.get("id"))),
+        "created_by": str(thread_data.get("author_id", auth.claims.get("id"))),
         "meta": {}
     }
     
+    mode = settings.THREAD_CHANNEL_CHECK
+    if mode == "optimistic":
+        return await _create_thread_optimistic(channel_id, payload, headers)
+    
+    # "cache": el estado del canal se toma del cache si está; "strict": siempre se consulta
+    await _check_channel_active(channel_id, headers, use_cache=(mode == "cache"))
     return await threads_client.post(
         "/v1",
         json=payload,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers=headers
     )
 
+
+async def _check_channel_active(channel_id: str, headers: Dict[str, str], use_cache: bool):
+    """Valida que el canal exista y esté activo (404 / 400 si no)"""
+    is_active = _channel_status.get(channel_id) if use_cache else None
+    if is_active is None:
+        try:
+            channel = await channel_client.get(
+                f"/v1/channels/{channel_id}",
+                headers=headers
+            )
+        except HTTPException as e:
+            if e.status_code == 404:
+                raise HTTPException(
+                    status_code=404,
+                    detail="Channel not found"
+                )
+            raise
+        _remember_channel(channel_id, channel)
+        is_active = channel.get("is_active", True)
+    
+    # Verificar que el canal está activo
+    if not is_active:
+        raise HTTPException(
+            status_code=400,
+            detail="Channel is not active"
+        )
+
+
+async def _create_thread_optimistic(channel_id: str, payload: Dict[str, Any], headers: Dict[str, str]):
+    """
+    Valida el canal y crea el thread en paralelo. Si la validación falla
+    después de crear el thread, se elimina (compensación) y se retorna el error.
+    """
+    check, created = await asyncio.gather(
+        _check_channel_active(channel_id, headers, use_cache=True),
+        threads_client.post("/v1", json=payload, headers=headers),
+        return_exceptions=True,
+    )
+    if isinstance(check, BaseException):
+        thread_id = (created.get("id") or created.get("thread_id")) if isinstance(created, dict) else None
+        if thread_id:
+            try:
+                await threads_client.delete(f"/v1/{thread_id}", headers=headers)
+            except HTTPException:
+                # El thread huérfano queda en un canal inexistente/inactivo
+                pass
+        raise check
+    if isinstance(created, BaseException):
+        raise created
+    return created
+
 @router.delete("/threads")
 async def delete_thread(
     thread_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Eliminar un thread
@@ -242,34 +312,119 @@ async def delete_thread(
     thread_id = thread_data.get("thread_id")
     return await threads_client.delete(
         f"/v1/{thread_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/{channel_id}/threads")
 async def get_channel_threads(
     channel_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener todos los threads de un canal"""
     return await threads_client.get(
         "/v1",
         params={"channel_id": channel_id},
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/threads/{thread_id}")
 async def get_thread(
     thread_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener un thread específico"""
     return await threads_client.get(
         f"/v1/{thread_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
+# ========== OVERVIEW ==========
+
+def _section_error(exc: BaseException) -> Dict[str, Any]:
+    if isinstance(exc, HTTPException):
+        return {"status_code": exc.status_code, "detail": exc.detail}
+    return {"status_code": 502, "detail": str(exc)}
+
+
+def _member_user_ids(members: Any) -> List[str]:
+    """Extrae los user_id de la respuesta de miembros (lista o {"members": [...]}).
+
+    `id` es el de la membresía, no el del usuario: sin user_id se omite.
+    """
+    if isinstance(members, dict):
+        members = members.get("members") or members.get("items") or []
+    user_ids = []
+    for member in members or []:
+        if isinstance(member, dict):
+            user_id = member.get("user_id")
+            if user_id:
+                user_ids.append(str(user_id))
+    return user_ids
+
+
+@router.get("/{channel_id}/overview")
+async def get_channel_overview(
+    channel_id: str,
+    auth: AuthContext = Depends(get_auth)
+):
+    """
+    Vista agregada de un canal: canal, miembros, threads y presencia de los miembros.
+    Las llamadas a los microservicios van en paralelo; si una sección falla
+    se informa en "errors" y el resto se retorna igual.
+    """
+    headers = {"Authorization": f"Bearer {auth.token}"}
+    subject = auth.claims.get("sub")
+    
+    async def members_with_presence():
+        members = await channel_client.get(
+            f"/v1/members/channel/{channel_id}",
+            headers=headers,
+            cache_ttl=settings.CACHE_TTL_CHANNEL_MEMBERS,
+            cache_subject=subject
+        )
+        try:
+            presence = await get_presence_many(_member_user_ids(members))
+        except HTTPException as e:
+            presence = e
+        return members, presence
+    
+    channel, threads, members = await asyncio.gather(
+        channel_client.get(
+            f"/v1/channels/{channel_id}",
+            headers=headers,
+            cache_ttl=settings.CACHE_TTL_CHANNEL,
+            cache_subject=subject
+        ),
+        threads_client.get("/v1", params={"channel_id": channel_id}, headers=headers),
+        members_with_presence(),
+        return_exceptions=True,
+    )
+    
+    # Sin canal no hay vista que mostrar
+    if isinstance(channel, HTTPException) and channel.status_code == 404:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    if not isinstance(channel, BaseException):
+        _remember_channel(channel_id, channel)
+    
+    overview: Dict[str, Any] = {"channel": None, "members": None, "threads": None, "presence": None}
+    errors: Dict[str, Any] = {}
+    for section, result in (("channel", channel), ("threads", threads)):
+        if isinstance(result, BaseException):
+            errors[section] = _section_error(result)
+        else:
+            overview[section] = result
+    if isinstance(members, BaseException):
+        errors["members"] = _section_error(members)
+    else:
+        overview["members"], presence = members
+        if isinstance(presence, BaseException):
+            errors["presence"] = _section_error(presence)
+        else:
+            overview["presence"] = presence
+    overview["errors"] = errors
+    return overview
+
 @router.get("/health")
 async def channels_health():
     """Health check del servicio de canales"""
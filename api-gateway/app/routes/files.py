@@ -1,19 +1,254 @@
-from fastapi import APIRouter, Depends, Header, UploadFile, File
-from fastapi.security import HTTPAuthorizationCredentials
-from typing import Dict, Any, Optional
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, UploadFile, File
+from multipart.multipart import parse_options_header
+from typing import AsyncIterator, Dict, Any, List, Optional
 from ..clients.base import ServiceClient
-from ..auth import get_current_user, security
+from ..auth import AuthContext, get_auth
+from ..cache import TTLCache
 from ..config import settings
 
 from ..clients.base import files_client
 
 router = APIRouter(prefix="/files", tags=["Files"])
 
+# Campo de formulario opcional con el SHA256 que el cliente espera
+CHECKSUM_FIELD = "checksum_sha256"
+
+
+class MultipartDigest:
+    """
+    Calcula el SHA256 de las partes con archivo de un body multipart a medida
+    que pasa por el gateway, sin guardar el body. También captura el campo
+    `checksum_sha256` si el cliente lo envía.
+
+    Busca los delimitadores con bytes.find (en C) en vez de recorrer el body
+    byte a byte: el costo por MB queda en el hash y no en el parseo.
+    """
+
+    MAX_HEADERS_BYTES = 16 * 1024
+
+    def __init__(self, content_type: str):
+        mime, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if mime != b"multipart/form-data" or not boundary:
+            raise HTTPException(
+                status_code=415,
+                detail="Content-Type must be multipart/form-data with a boundary"
+            )
+        self.sha256 = hashlib.sha256()
+        self.file_bytes = 0
+        self.declared_checksum: Optional[str] = None
+        self._delimiter = b"\r\n--" + boundary
+        # El primer delimitador no va precedido de CRLF
+        self._buffer = b"\r\n"
+        self._in_headers = False
+        self._done = False
+        self._disposition: Optional[Dict[bytes, bytes]] = None
+        self._field_value = bytearray()
+
+    def write(self, chunk: bytes) -> None:
+        if self._done:
+            return
+        buffer = self._buffer + chunk
+        while True:
+            if self._in_headers:
+                end = buffer.find(b"\r\n\r\n")
+                if end == -1:
+                    if len(buffer) > self.MAX_HEADERS_BYTES:
+                        raise HTTPException(status_code=400, detail="Multipart part headers too large")
+                    break
+                self._begin_part(buffer[:end])
+                buffer = buffer[end + 4:]
+                self._in_headers = False
+                continue
+            
+            index = buffer.find(self._delimiter)
+            if index == -1:
+                # Se guarda sólo una cola por si el delimitador quedó partido entre chunks
+                keep = len(self._delimiter) - 1
+                if len(buffer) > keep:
+                    self._part_data(memoryview(buffer)[:len(buffer) - keep])
+                    buffer = buffer[len(buffer) - keep:]
+                break
+            
+            after = index + len(self._delimiter)
+            if len(buffer) < after + 2:
+                self._part_data(memoryview(buffer)[:index])
+                buffer = buffer[index:]
+                break
+            self._part_data(memoryview(buffer)[:index])
+            self._end_part()
+            if buffer[after:after + 2] == b"--":
+                self._done = True
+                buffer = b""
+                break
+            buffer = buffer[after + 2:]
+            self._in_headers = True
+        self._buffer = buffer
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
+    def _begin_part(self, headers: bytes):
+        self._disposition = {}
+        self._field_value = bytearray()
+        for line in headers.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-disposition":
+                self._disposition = parse_options_header(value.strip())[1]
+
+    def _part_data(self, data: memoryview):
+        if self._disposition is None or not len(data):
+            return
+        if b"filename" in self._disposition:
+            self.sha256.update(data)
+            self.file_bytes += len(data)
+        elif self._disposition.get(b"name") == CHECKSUM_FIELD.encode() and len(self._field_value) < 128:
+            self._field_value += data
+
+    def _end_part(self):
+        if self._disposition is not None and self._disposition.get(b"name") == CHECKSUM_FIELD.encode():
+            self.declared_checksum = self._field_value.decode("ascii", "ignore").strip().lower()
+        self._disposition = None
+
+
+async def _digesting(chunks: AsyncIterator[bytes], digest: MultipartDigest) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        digest.write(chunk)
+        yield chunk
+
+
+async def stream_upload(
+    client: ServiceClient,
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    headers: Dict[str, str],
+    params: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Reenvía un body multipart al servicio de archivos por partes, calculando
+    el SHA256 del archivo en el camino. Si no coincide con el declarado por el
+    cliente o con el que reporta el servicio, se elimina el archivo subido.
+    `params` (message_id, thread_id) asocia el archivo a un mensaje o hilo.
+    """
+    digest = MultipartDigest(content_type)
+    result = await client.post_stream(
+        "/v1/files",
+        content=_digesting(chunks, digest),
+        headers={**headers, "Content-Type": content_type},
+        params=params
+    )
+    computed = digest.hexdigest()
+    upstream = str(result.get("checksum_sha256") or "").lower() if isinstance(result, dict) else ""
+    
+    error = None
+    if digest.declared_checksum and digest.declared_checksum != computed:
+        error = HTTPException(status_code=400, detail={
+            "detail": "Checksum mismatch", "expected": digest.declared_checksum, "computed": computed
+        })
+    elif upstream and upstream != computed:
+        error = HTTPException(status_code=502, detail={
+            "detail": "Checksum mismatch between gateway and files service",
+            "upstream": upstream, "computed": computed
+        })
+    if error is not None:
+        file_id = result.get("id") if isinstance(result, dict) else None
+        if file_id:
+            try:
+                await client.delete(f"/v1/files/{file_id}", headers=headers)
+            except HTTPException:
+                pass
+        raise error
+    
+    if isinstance(result, dict):
+        result = {**result, "checksum_sha256": upstream or computed}
+    return result
+
+
+# file_id -> respuesta de presign-download, compartida entre usuarios hasta poco antes de expirar
+_presign_cache = TTLCache(settings.PRESIGN_CACHE_MAX_ENTRIES, settings.PRESIGN_DEFAULT_TTL_SECONDS)
+# (sub, file_id) con acceso ya verificado contra el servicio de archivos
+_file_access = TTLCache(settings.PRESIGN_CACHE_MAX_ENTRIES, settings.FILE_ACCESS_TTL_SECONDS)
+
+
+def _presign_expires_at(presign: Any) -> Optional[float]:
+    """Instante (epoch) en que vence la URL: expires_at/expires_in o la firma X-Amz-*"""
+    if not isinstance(presign, dict):
+        return None
+    if isinstance(presign.get("expires_in"), (int, float)):
+        return time.time() + presign["expires_in"]
+    if isinstance(presign.get("expires_at"), str):
+        try:
+            expires_at = datetime.fromisoformat(presign["expires_at"].replace("Z", "+00:00"))
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            return expires_at.timestamp()
+        except ValueError:
+            pass
+    for key in ("url", "download_url", "presigned_url"):
+        if presign.get(key):
+            query = parse_qs(urlsplit(presign[key]).query)
+            if "X-Amz-Date" in query and "X-Amz-Expires" in query:
+                try:
+                    signed_at = datetime.strptime(query["X-Amz-Date"][0], "%Y%m%dT%H%M%SZ")
+                    return signed_at.replace(tzinfo=timezone.utc).timestamp() + int(query["X-Amz-Expires"][0])
+                except ValueError:
+                    return None
+    return None
+
+
+async def _ensure_file_access(auth: AuthContext, file_id: str, headers: Dict[str, str]):
+    """Verifica (y recuerda) que el usuario puede ver el archivo; 403/404 si no"""
+    key = (auth.claims.get("sub"), file_id)
+    if _file_access.get(key):
+        return
+    await files_client.get(f"/v1/files/{file_id}", headers=headers)
+    _file_access.set(key, True)
+
+
+async def presign_download(file_id: str, auth: AuthContext) -> Any:
+    """
+    URL pre-firmada de descarga. Se reutiliza la misma URL para todos los
+    usuarios con acceso al archivo hasta PRESIGN_EXPIRY_MARGIN_SECONDS antes
+    de que expire; cada usuario se autoriza por separado.
+    """
+    headers = {"Authorization": f"Bearer {auth.token}"}
+    cached = _presign_cache.get(file_id)
+    if cached is not None:
+        await _ensure_file_access(auth, file_id, headers)
+        return cached
+    
+    presign = await files_client.post(
+        f"/v1/files/{file_id}/presign-download",
+        json={},
+        headers=headers
+    )
+    # El servicio sólo firma si el usuario tiene acceso
+    _file_access.set((auth.claims.get("sub"), file_id), True)
+    expires_at = _presign_expires_at(presign)
+    ttl = settings.PRESIGN_DEFAULT_TTL_SECONDS
+    if expires_at is not None:
+        ttl = min(expires_at - time.time() - settings.PRESIGN_EXPIRY_MARGIN_SECONDS, settings.PRESIGN_MAX_TTL_SECONDS)
+    if ttl > 0:
+        _presign_cache.set(file_id, presign, ttl)
+    return presign
+
+
+def _presigned_url(presign: Any) -> str:
+    if isinstance(presign, dict):
+        for key in ("url", "download_url", "presigned_url"):
+            if presign.get(key):
+                return presign[key]
+    raise HTTPException(status_code=502, detail="Files service returned no download URL")
+
 @router.post("/")
 async def upload_file(
     file_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Subir un archivo
@@ -27,59 +262,128 @@ async def upload_file(
     return await files_client.post(
         "/v1/files",
         json=file_data,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
+    )
+
+@router.post("/upload")
+async def upload_file_stream(
+    request: Request,
+    auth: AuthContext = Depends(get_auth)
+):
+    """
+    Subir un archivo en streaming (multipart/form-data)
+    El body se reenvía tal cual al servicio de archivos, por partes y sin
+    cargarlo completo en memoria. Campo opcional `checksum_sha256` para que
+    el gateway verifique la integridad del archivo.
+    """
+    headers = {"Authorization": f"Bearer {auth.token}"}
+    if "content-length" in request.headers:
+        headers["Content-Length"] = request.headers["content-length"]
+    return await stream_upload(
+        files_client,
+        request.stream(),
+        request.headers.get("content-type", ""),
+        headers,
+        dict(request.query_params)
     )
 
 @router.get("/")
 async def list_files(
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener lista de archivos"""
     return await files_client.get(
         "/v1/files",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/{file_id}")
 async def get_file(
     file_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener información de un archivo"""
     return await files_client.get(
         f"/v1/files/{file_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
+@router.post("/download/batch")
+async def get_download_urls(
+    batch_data: Dict[str, Any],
+    auth: AuthContext = Depends(get_auth)
+):
+    """
+    Obtener URLs de descarga pre-firmadas de varios archivos
+    Body: {
+        "file_ids": ["file-id", ...]
+    }
+    Retorna: { "urls": { "file-id": {...} }, "errors": { "file-id": {"status_code", "detail"} } }
+    """
+    file_ids = batch_data.get("file_ids")
+    if not isinstance(file_ids, list) or not all(isinstance(f, str) for f in file_ids):
+        raise HTTPException(status_code=422, detail="file_ids must be a list of strings")
+    if len(file_ids) > settings.PRESIGN_BATCH_MAX:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.PRESIGN_BATCH_MAX} file_ids per request"
+        )
+    
+    semaphore = asyncio.Semaphore(settings.PRESIGN_BATCH_CONCURRENCY)
+    
+    async def presign(file_id: str):
+        async with semaphore:
+            return await presign_download(file_id, auth)
+    
+    unique_ids: List[str] = list(dict.fromkeys(file_ids))
+    results = await asyncio.gather(*(presign(file_id) for file_id in unique_ids), return_exceptions=True)
+    urls: Dict[str, Any] = {}
+    errors: Dict[str, Any] = {}
+    for file_id, result in zip(unique_ids, results):
+        if isinstance(result, HTTPException):
+            errors[file_id] = {"status_code": result.status_code, "detail": result.detail}
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            urls[file_id] = result
+    return {"urls": urls, "errors": errors}
+
 @router.post("/{file_id}/download")
 async def get_download_url(
     file_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Obtener URL de descarga pre-firmada
     Retorna una URL temporal para descargar el archivo
     """
-    return await files_client.post(
-        f"/v1/files/{file_id}/presign-download",
-        json={},
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
-    )
+    return await presign_download(file_id, auth)
+
+@router.get("/{file_id}/content")
+async def download_file(
+    file_id: str,
+    auth: AuthContext = Depends(get_auth)
+):
+    """
+    Descargar el contenido de un archivo a través del gateway
+    Para clientes que no alcanzan MinIO directamente: los bytes se reenvían
+    por partes desde la URL pre-firmada.
+    """
+    presign = await presign_download(file_id, auth)
+    return await files_client.stream_url(_presigned_url(presign))
 
 @router.delete("/{file_id}")
 async def delete_file(
     file_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Eliminar un archivo"""
-    return await files_client.delete(
+    result = await files_client.delete(
         f"/v1/files/{file_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
+    _presign_cache.invalidate(file_id)
+    return result
 
 @router.get("/health")
 async def files_health():
@@ -1,8 +1,7 @@
 from fastapi import APIRouter, Depends, Header
-from fastapi.security import HTTPAuthorizationCredentials
 from typing import Dict, Any
 from ..clients.base import messages_client
-from ..auth import get_current_user, security
+from ..auth import AuthContext, get_auth
 
 router = APIRouter(prefix="/messages", tags=["Messages"])
 
@@ -10,8 +9,7 @@ router = APIRouter(prefix="/messages", tags=["Messages"])
 async def send_message(
     thread_id: str,
     message_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Enviar mensaje a un thread
@@ -23,19 +21,19 @@ async def send_message(
     return await messages_client.post(
         f"/threads/{thread_id}/messages",
         json=message_data,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/threads/{thread_id}")
 async def get_thread_messages(
     thread_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener todos los mensajes de un thread"""
-    return await messages_client.get(
+    return await messages_client.stream(
+        "GET",
         f"/threads/{thread_id}/messages",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.put("/threads/{thread_id}/messages/{message_id}")
@@ -43,8 +41,7 @@ async def update_message(
     thread_id: str,
     message_id: str,
     message_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """
     Actualizar un mensaje específico
@@ -55,18 +52,17 @@ async def update_message(
     return await messages_client.put(
         f"/threads/{thread_id}/messages/{message_id}",
         json=message_data,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.delete("/threads/{thread_id}/messages/{message_id}")
 async def delete_message(
     thread_id: str,
     message_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Eliminar un mensaje específico"""
     return await messages_client.delete(
         f"/threads/{thread_id}/messages/{message_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
@@ -1,11 +1,93 @@
-from fastapi import APIRouter, Depends, Header
-from fastapi.security import HTTPAuthorizationCredentials
-from typing import Dict, Any, Optional
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import Dict, Any, List, Optional, Tuple
 from ..clients.base import moderation_client
-from ..auth import get_current_user, optional_auth, security
+from ..auth import AuthContext, get_auth, get_current_user, optional_auth
+from ..batching import MicroBatcher
+from ..blacklist import BlacklistMatcher, severity_name, word_entries
+from ..config import settings
+from ..verdicts import VerdictCache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/moderation", tags=["Moderation"])
 
+
+async def _fetch_blacklist_page(limit: int, skip: int):
+    return await moderation_client.get(
+        "/api/v1/blacklist/words",
+        params={"limit": limit, "skip": skip}
+    )
+
+
+blacklist = BlacklistMatcher(
+    _fetch_blacklist_page,
+    min_severity=settings.MODERATION_PREFILTER_MIN_SEVERITY,
+    sync_interval=settings.MODERATION_BLACKLIST_SYNC_SECONDS,
+    page_size=settings.MODERATION_BLACKLIST_PAGE_SIZE,
+)
+
+verdicts = VerdictCache(
+    settings.MODERATION_VERDICT_CACHE_MAX_ENTRIES,
+    ttl=settings.MODERATION_VERDICT_CACHE_TTL_SECONDS,
+    clean_ttl=settings.MODERATION_CLEAN_USER_TTL_SECONDS,
+)
+
+
+async def _check_one(content: Dict[str, Any]):
+    return await moderation_client.post("/api/v1/moderation/check", json=content)
+
+
+async def _check_batch(contents: List[Dict[str, Any]]) -> List[Any]:
+    response = await moderation_client.post(settings.MODERATION_BATCH_ENDPOINT, json={"messages": contents})
+    if isinstance(response, dict):
+        response = response.get("results") or response.get("items") or response.get("verdicts")
+    if not isinstance(response, list):
+        raise HTTPException(status_code=502, detail="Invalid moderation batch response")
+    return response
+
+
+check_batcher = MicroBatcher(
+    _check_one,
+    _check_batch if settings.MODERATION_BATCH_ENDPOINT else None,
+    window=settings.MODERATION_BATCH_WINDOW_SECONDS,
+    max_size=settings.MODERATION_BATCH_MAX_SIZE,
+    concurrency=settings.MODERATION_BATCH_CONCURRENCY,
+)
+
+# Con MODERATION_PREFILTER_REPORT_HITS los bloqueos locales se envían igual a
+# /check en segundo plano para que el servicio registre el strike (corre el modelo)
+_hit_reports = set()
+
+
+def _report_hit(content: Dict[str, Any]):
+    """El servicio sigue registrando la infracción aunque el gateway ya respondió."""
+    async def report():
+        try:
+            await check_batcher.call_one(content)
+        except Exception:
+            logger.warning("No se pudo reportar un bloqueo por blacklist", exc_info=True)
+    
+    task = asyncio.create_task(report())
+    _hit_reports.add(task)
+    task.add_done_callback(_hit_reports.discard)
+
+
+def _blocked_verdict(matches: List[Tuple[str, int]]) -> Dict[str, Any]:
+    """Mismo formato que ModerateMessageResponse del servicio."""
+    return {
+        "is_approved": False,
+        "action": "blocked",
+        "severity": severity_name(max(rank for _, rank in matches)),
+        "toxicity_score": 1.0,
+        # El gateway no conoce ni registra strikes
+        "strike_count": 0,
+        "message": "Mensaje bloqueado: contiene palabras prohibidas",
+        "detected_words": [word for word, _ in matches],
+    }
+
+
 @router.post("/check")
 async def check_content(
     content: Dict[str, Any],
@@ -19,20 +101,46 @@ async def check_content(
         "user_id": "user-id",
         "channel_id": "channel-id"
     }
+    Los mensajes con palabras de la blacklist de severidad alta se rechazan
+    en el gateway; el resto se envía al modelo, salvo que el mismo contenido
+    ya haya sido aprobado hace poco.
     """
-    return await moderation_client.post("/api/v1/moderation/check", json=content)
+    if settings.MODERATION_PREFILTER_ENABLED and blacklist.synced:
+        matches = blacklist.blocking_words(str(content.get("content") or ""))
+        if matches:
+            blacklist.blocked += 1
+            if settings.MODERATION_PREFILTER_REPORT_HITS:
+                _report_hit(content)
+            verdict = _blocked_verdict(matches)
+            verdicts.record(content, verdict)
+            return verdict
+        blacklist.forwarded += 1
+    if settings.MODERATION_VERDICT_CACHE_ENABLED:
+        cached = verdicts.lookup(content)
+        if cached is not None:
+            return cached
+    if settings.MODERATION_BATCHING_ENABLED and check_batcher.send_batch is not None:
+        result = await check_batcher.submit(content)
+    elif settings.MODERATION_BATCHING_ENABLED:
+        # Sin endpoint de lotes la ventana solo sumaría latencia: llamada
+        # directa, acotada por MODERATION_BATCH_CONCURRENCY
+        result = await check_batcher.call_one(content)
+    else:
+        result = await _check_one(content)
+    if settings.MODERATION_VERDICT_CACHE_ENABLED:
+        verdicts.record(content, result)
+    return result
 
 @router.get("/status/{user_id}/{channel_id}")
 async def get_user_moderation_status(
     user_id: str,
     channel_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener estado de moderación de un usuario en un canal"""
     return await moderation_client.get(
         f"/api/v1/moderation/status/{user_id}/{channel_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/blacklist")
@@ -44,39 +152,52 @@ async def get_blacklist(
     """Obtener lista de palabras prohibidas"""
     return await moderation_client.get(
         "/api/v1/blacklist/words",
-        params={"limit": limit, "skip": skip}
+        params={"limit": limit, "skip": skip},
+        cache_ttl=settings.CACHE_TTL_BLACKLIST
     )
 
 @router.post("/blacklist")
 async def add_to_blacklist(
     word_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Agregar palabra a blacklist (requiere permisos de admin)"""
-    return await moderation_client.post(
+    result = await moderation_client.post(
         "/api/v1/blacklist/words",
         json=word_data,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
+    moderation_client.invalidate("/api/v1/blacklist/words")
+    entries = word_entries(result)
+    if not entries:
+        # SuccessResponse: el id real viene en `data`; sin él la copia local
+        # quedaría indexada por el texto y un DELETE por id no la quitaría
+        data = result.get("data") if isinstance(result, dict) else None
+        entries = [{**word_data, **data} if isinstance(data, dict) else word_data]
+    for entry in entries:
+        blacklist.add(entry)
+    # Un contenido aprobado puede contener la palabra nueva
+    verdicts.clear()
+    return result
 
 @router.delete("/blacklist/{word_id}")
 async def remove_from_blacklist(
     word_id: str,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Eliminar palabra de blacklist"""
-    return await moderation_client.delete(
+    result = await moderation_client.delete(
         f"/api/v1/blacklist/words/{word_id}",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
+    moderation_client.invalidate("/api/v1/blacklist/words")
+    blacklist.remove(word_id)
+    return result
 
 @router.get("/admin/banned-users")
 async def get_banned_users(
     channel_id: Optional[str] = None,
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener lista de usuarios baneados"""
     params = {}
@@ -85,5 +206,5 @@ async def get_banned_users(
     return await moderation_client.get(
         "/api/v1/admin/banned-users",
         params=params,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
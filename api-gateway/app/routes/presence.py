@@ -1,10 +1,91 @@
-from fastapi import APIRouter, Depends, Header, Query
-from typing import Dict, Any, Optional
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import JSONResponse
+from typing import Dict, Any, List, Optional
 from ..clients.base import presence_client
 from ..auth import get_current_user, optional_auth
+from ..cache import TTLCache
+from ..config import settings
+from ..heartbeats import HeartbeatBuffer
 
 router = APIRouter(prefix="/presence", tags=["Presence"])
 
+# user_id -> presencia (None = sin registro), por unos segundos
+_presence_cache = TTLCache(settings.PRESENCE_CACHE_MAX_ENTRIES, settings.PRESENCE_CACHE_TTL_SECONDS)
+
+
+async def _send_presence_update(user_id: str, update: Dict[str, Any]):
+    await presence_client.patch(f"/api/v1.0.0/presence/{user_id}", json=update)
+    _presence_cache.invalidate(user_id)
+
+
+# StatusEnum del servicio de presencia
+PRESENCE_STATUSES = ("online", "offline")
+
+
+def _is_coalescable(update: Dict[str, Any]) -> bool:
+    """Sólo un cambio de status o un heartbeat puros (el servicio no acepta ambos)."""
+    if update == {"heartbeat": True}:
+        return True
+    return set(update) == {"status"} and update["status"] in PRESENCE_STATUSES
+
+
+heartbeats = HeartbeatBuffer(
+    _send_presence_update,
+    interval=settings.HEARTBEAT_FLUSH_INTERVAL,
+    concurrency=settings.HEARTBEAT_FLUSH_CONCURRENCY,
+)
+
+
+def _presence_items(listing: Any) -> List[Dict[str, Any]]:
+    if isinstance(listing, dict):
+        listing = listing.get("items") or listing.get("data") or listing.get("presence") or []
+    return [item for item in listing or [] if isinstance(item, dict)]
+
+
+async def get_presence_many(user_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Presencia de varios usuarios. Los que no están en cache se piden en paralelo
+    (con concurrencia acotada) o, si son muchos, con un solo listado filtrado aquí.
+    """
+    unique_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+    result: Dict[str, Optional[Dict[str, Any]]] = {}
+    missing = []
+    for user_id in unique_ids:
+        cached = _presence_cache.get(user_id, default=_presence_cache)
+        if cached is _presence_cache:
+            missing.append(user_id)
+        else:
+            result[user_id] = cached
+    
+    if len(missing) > settings.PRESENCE_BATCH_LIST_THRESHOLD:
+        listing = await presence_client.get("/api/v1.0.0/presence")
+        by_user = {}
+        for item in _presence_items(listing):
+            user_id = item.get("userId") or item.get("user_id")
+            if user_id is not None:
+                by_user[str(user_id)] = item
+        fetched = {user_id: by_user.get(user_id) for user_id in missing}
+    else:
+        semaphore = asyncio.Semaphore(settings.PRESENCE_BATCH_CONCURRENCY)
+        
+        async def fetch(user_id: str):
+            async with semaphore:
+                try:
+                    return await presence_client.get(f"/api/v1.0.0/presence/{user_id}")
+                except HTTPException as e:
+                    if e.status_code == 404:
+                        return None
+                    raise
+        
+        values = await asyncio.gather(*(fetch(user_id) for user_id in missing))
+        fetched = dict(zip(missing, values))
+    
+    for user_id, presence in fetched.items():
+        _presence_cache.set(user_id, presence)
+    result.update(fetched)
+    return {user_id: result[user_id] for user_id in unique_ids}
+
 @router.post("/")
 async def register_presence(
     presence_data: Dict[str, Any],
@@ -34,14 +115,29 @@ async def list_presence(
         params["status"] = status
     return await presence_client.get("/api/v1.0.0/presence", params=params)
 
-@router.get("/{user_id}")
-async def get_user_presence(
-    user_id: str,
+@router.post("/batch")
+async def get_presence_batch(
+    batch_data: Dict[str, Any],
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
-    """Obtener estado de presencia de un usuario específico"""
-    return await presence_client.get(f"/api/v1.0.0/presence/{user_id}")
+    """
+    Obtener la presencia de varios usuarios en una sola llamada
+    Body: {
+        "user_ids": ["user-id", ...]
+    }
+    Retorna: { "presence": { "user-id": {...} | null } }
+    """
+    user_ids = batch_data.get("user_ids")
+    if not isinstance(user_ids, list) or not all(isinstance(u, str) for u in user_ids):
+        raise HTTPException(status_code=422, detail="user_ids must be a list of strings")
+    if len(user_ids) > settings.PRESENCE_BATCH_MAX:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.PRESENCE_BATCH_MAX} user_ids per request"
+        )
+    return {"presence": await get_presence_many(user_ids)}
 
+# Declarada antes de /{user_id} para que "stats" no se tome como un user_id
 @router.get("/stats")
 async def get_presence_stats(
     current_user: Optional[Dict] = Depends(optional_auth)
@@ -50,7 +146,18 @@ async def get_presence_stats(
     Obtener estadísticas de presencia
     Retorna: { "online": count, "offline": count }
     """
-    return await presence_client.get("/api/v1.0.0/presence/stats")
+    return await presence_client.get(
+        "/api/v1.0.0/presence/stats",
+        cache_ttl=settings.CACHE_TTL_PRESENCE_STATS
+    )
+
+@router.get("/{user_id}")
+async def get_user_presence(
+    user_id: str,
+    current_user: Optional[Dict] = Depends(optional_auth)
+):
+    """Obtener estado de presencia de un usuario específico"""
+    return await presence_client.get(f"/api/v1.0.0/presence/{user_id}")
 
 @router.patch("/{user_id}")
 async def update_user_presence(
@@ -64,7 +171,25 @@ async def update_user_presence(
         "status": "online|offline" (opcional),
         "heartbeat": true (opcional, para mantener vivo)
     }
+    Con HEARTBEAT_COALESCING_ENABLED un body que sólo trae un status válido o
+    `heartbeat: true` se encola y se responde 202 de inmediato con la última
+    presencia conocida; el gateway lo envía en el siguiente flush periódico.
+    Cualquier otro body se envía tal cual al servicio.
     """
+    status = update_data.get("status")
+    if status is not None and status not in PRESENCE_STATUSES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"status must be one of: {', '.join(PRESENCE_STATUSES)}"
+        )
+    if settings.HEARTBEAT_COALESCING_ENABLED and _is_coalescable(update_data):
+        heartbeats.absorb(user_id, update_data)
+        presence = dict(_presence_cache.get(user_id) or {"userId": user_id})
+        pending = heartbeats.pending_status(user_id)
+        if pending is not None:
+            presence["status"] = pending
+        presence["queued"] = True
+        return JSONResponse(status_code=202, content=presence)
     return await presence_client.patch(
         f"/api/v1.0.0/presence/{user_id}",
         json=update_data
@@ -76,6 +201,9 @@ async def delete_user_presence(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Eliminar registro de presencia de un usuario"""
+    # Un heartbeat pendiente no debe recrear la presencia recién eliminada
+    heartbeats.discard(user_id)
+    _presence_cache.invalidate(user_id)
     return await presence_client.delete(f"/api/v1.0.0/presence/{user_id}")
 
 @router.get("/health")
@@ -11,7 +11,7 @@ async def search_messages(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Búsqueda de mensajes"""
-    return await search_client.get("/api/message/search_message", params={"q": q})
+    return await search_client.stream("GET", "/api/message/search_message", params={"q": q})
 
 @router.get("/files")
 async def search_files(
@@ -19,7 +19,7 @@ async def search_files(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Búsqueda de archivos"""
-    return await search_client.get("/api/files/search_files", params={"q": q})
+    return await search_client.stream("GET", "/api/files/search_files", params={"q": q})
 
 @router.get("/channels")
 async def search_channels(
@@ -27,7 +27,7 @@ async def search_channels(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Búsqueda de canales"""
-    return await search_client.get("/api/channel/search_channel", params={"q": q})
+    return await search_client.stream("GET", "/api/channel/search_channel", params={"q": q})
 
 @router.get("/threads/id/{thread_id}")
 async def get_thread_by_id(
@@ -35,7 +35,7 @@ async def get_thread_by_id(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Obtener thread por ID"""
-    return await search_client.get(f"/api/threads/id/{thread_id}")
+    return await search_client.stream("GET", f"/api/threads/id/{thread_id}")
 
 @router.get("/threads/author/{author}")
 async def search_threads_by_author(
@@ -43,7 +43,7 @@ async def search_threads_by_author(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Buscar threads por autor"""
-    return await search_client.get(f"/api/threads/author/{author}")
+    return await search_client.stream("GET", f"/api/threads/author/{author}")
 
 @router.get("/threads/keyword/{keyword}")
 async def search_threads_by_keyword(
@@ -51,7 +51,7 @@ async def search_threads_by_keyword(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Buscar threads por palabra clave"""
-    return await search_client.get(f"/api/threads/keyword/{keyword}")
+    return await search_client.stream("GET", f"/api/threads/keyword/{keyword}")
 
 @router.get("/threads/status/{status}")
 async def search_threads_by_status(
@@ -59,7 +59,7 @@ async def search_threads_by_status(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Buscar threads por estado"""
-    return await search_client.get(f"/api/threads/status/{status}")
+    return await search_client.stream("GET", f"/api/threads/status/{status}")
 
 @router.get("/threads/daterange")
 async def search_threads_by_daterange(
@@ -68,7 +68,8 @@ async def search_threads_by_daterange(
     current_user: Optional[Dict] = Depends(optional_auth)
 ):
     """Buscar threads por rango de fechas"""
-    return await search_client.get(
+    return await search_client.stream(
+        "GET",
         "/api/threads/daterange",
         params={"start_date": start_date, "end_date": end_date}
     )
@@ -1,8 +1,7 @@
 from fastapi import APIRouter, Depends, Header
-from fastapi.security import HTTPAuthorizationCredentials
 from typing import Dict, Any, Optional
 from ..clients.base import users_client
-from ..auth import get_current_user, optional_auth, security
+from ..auth import AuthContext, get_auth, optional_auth
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -18,26 +17,24 @@ async def login(credentials: Dict[str, Any]):
 
 @router.get("/me")
 async def get_me(
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Obtener perfil del usuario actual"""
     return await users_client.get(
         "/usersservice/v1/users/me",
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.patch("/me")
 async def update_me(
     user_data: Dict[str, Any],
-    current_user: Dict = Depends(get_current_user),
-    token_creds: HTTPAuthorizationCredentials = Depends(security)
+    auth: AuthContext = Depends(get_auth)
 ):
     """Actualizar perfil del usuario actual"""
     return await users_client.patch(
         "/usersservice/v1/users/me",
         json=user_data,
-        headers={"Authorization": f"Bearer {token_creds.credentials}"}
+        headers={"Authorization": f"Bearer {auth.token}"}
     )
 
 @router.get("/health")
@@ -0,0 +1,94 @@
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+from .blacklist import normalize
+from .cache import TTLCache
+
+# Campos propios de cada petición: si el veredicto los trae se reemplazan
+REQUEST_FIELDS = ("message_id", "user_id", "channel_id")
+STRIKE_FIELDS = ("strike_count", "strikes", "strikes_count", "warnings")
+
+
+def content_key(content: str) -> str:
+    """Hash del texto normalizado (minúsculas, sin tildes, espacios colapsados)."""
+    text = " ".join(normalize(content).split())
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_approved(verdict: Dict[str, Any]) -> Optional[bool]:
+    """Aprobado según ModerateMessageResponse (`is_approved`/`action`); `is_toxic` como respaldo."""
+    if "is_approved" in verdict:
+        return verdict["is_approved"] is True
+    if "action" in verdict:
+        return verdict["action"] == "approved"
+    if "is_toxic" in verdict:
+        return verdict["is_toxic"] is False
+    return None
+
+
+class VerdictCache:
+    """Veredictos de moderación memoizados por contenido.
+
+    Solo se guardan los veredictos aprobados de usuarios sin strikes: un
+    mensaje no aprobado siempre llega al servicio para que registre el
+    strike. El cache solo responde a un (usuario, canal) cuyo último
+    veredicto fue aprobado con 0 strikes en los últimos `clean_ttl`
+    segundos; así el `strike_count` cacheado (0) también es el suyo y el
+    servicio sigue decidiendo para quien tiene historial.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clean_ttl: float):
+        self._verdicts = TTLCache(maxsize, ttl)
+        self._clean = TTLCache(maxsize, clean_ttl)
+        self.bypassed = 0
+
+    @staticmethod
+    def _subject(body: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        user_id = body.get("user_id")
+        if not user_id:
+            return None
+        return str(user_id), str(body.get("channel_id") or "")
+
+    @staticmethod
+    def _has_strikes(verdict: Dict[str, Any]) -> bool:
+        for field in STRIKE_FIELDS:
+            value = verdict.get(field)
+            if isinstance(value, (int, float)) and value > 0:
+                return True
+        return False
+
+    def lookup(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        content = body.get("content")
+        subject = self._subject(body)
+        if not isinstance(content, str) or subject is None or not self._clean.get(subject):
+            self.bypassed += 1
+            return None
+        verdict = self._verdicts.get(content_key(content))
+        if verdict is None:
+            return None
+        return {**verdict, **{field: body.get(field) for field in REQUEST_FIELDS if field in verdict}}
+
+    def record(self, body: Dict[str, Any], verdict: Any) -> None:
+        content = body.get("content")
+        subject = self._subject(body)
+        if not isinstance(verdict, dict) or not isinstance(content, str) or subject is None:
+            return
+        if is_approved(verdict) is not True or self._has_strikes(verdict):
+            self._clean.invalidate(subject)
+            return
+        self._clean.set(subject, True)
+        self._verdicts.set(content_key(content), verdict)
+
+    def clear(self) -> None:
+        self._verdicts.clear()
+
+    def snapshot(self) -> dict:
+        hits, misses = self._verdicts.hits, self._verdicts.misses
+        return {
+            "entries": len(self._verdicts),
+            "hits": hits,
+            "misses": misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "clean_subjects": len(self._clean),
+        }
@@ -0,0 +1,61 @@
+"""Microbenchmark del costo de autenticación por petición en el gateway.
+
+Compara verificar el JWT con python-jose en cada petición contra la
+dependency `get_auth` con el cache de tokens verificados. Desde api-gateway/:
+
+    python -m benchmarks.bench_auth --tokens 100 --requests 20000
+
+`--tokens` simula cuántos usuarios distintos hay activos a la vez.
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+from app.auth import get_auth
+from app.config import settings
+
+
+def build_tokens(count: int) -> list:
+    exp = int(time.time()) + 3600
+    return [
+        jwt.encode({"sub": f"user-{i}", "exp": exp}, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
+        for i in range(count)
+    ]
+
+
+def uncached(token: str) -> dict:
+    return jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
+
+
+async def measure(label: str, fn, tokens: list, requests: int) -> None:
+    started = time.perf_counter()
+    for i in range(requests):
+        await fn(tokens[i % len(tokens)])
+    per_request = (time.perf_counter() - started) / requests * 1_000_000
+    print(f"{label:<22} {per_request:8.2f} µs/petición")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    tokens = build_tokens(args.tokens)
+
+    async def decode_each_time(token):
+        return uncached(token)
+
+    async def cached_dependency(token):
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        return await get_auth(credentials)
+
+    await measure("jwt.decode por petición", decode_each_time, tokens, args.requests)
+    await measure("get_auth (con cache)", cached_dependency, tokens, args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""Benchmark de CPU por petición: proxy JSON (decode + re-encode) vs streaming.
+
+No toca la red: el microservicio se simula con httpx.MockTransport y el
+mismo payload se sirve en los dos modos. Desde api-gateway/:
+
+    python -m benchmarks.bench_proxy_modes --items 2000 --requests 300
+
+Mide tiempo de CPU del proceso (time.process_time) por petición para:
+  - json:   ServiceClient.get() + serialización de FastAPI (jsonable_encoder)
+  - stream: ServiceClient.stream() consumiendo el body como lo haría Starlette
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.clients.base import ServiceClient
+
+
+def build_payload(items: int) -> bytes:
+    messages = [
+        {
+            "id": f"msg-{i}",
+            "thread_id": "thread-1",
+            "author": f"user-{i % 50}",
+            "content": "mensaje de prueba " * 8,
+            "type": "text",
+            "created_at": "2026-10-17T12:00:00Z",
+            "attachments": [],
+        }
+        for i in range(items)
+    ]
+    return json.dumps({"items": messages, "next_cursor": None}).encode("utf-8")
+
+
+def build_client(body: bytes) -> ServiceClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            stream=httpx.ByteStream(body),
+            headers={"Content-Type": "application/json"},
+        )
+
+    client = ServiceClient("http://messages.bench", name="bench")
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+async def json_mode(client: ServiceClient) -> int:
+    data = await client._request("GET", "/threads/t1/messages")
+    return len(JSONResponse(jsonable_encoder(data)).body)
+
+
+async def stream_mode(client: ServiceClient) -> int:
+    response = await client.stream("GET", "/threads/t1/messages")
+    size = 0
+    async for chunk in response.body_iterator:
+        size += len(chunk)
+    await response.background()
+    return size
+
+
+async def measure(label: str, fn, client: ServiceClient, requests: int) -> None:
+    for _ in range(5):
+        await fn(client)
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    for _ in range(requests):
+        size = await fn(client)
+    cpu = (time.process_time() - cpu_started) / requests * 1000
+    wall = (time.perf_counter() - wall_started) / requests * 1000
+    print(f"{label:<8} cpu={cpu:8.3f} ms/req  wall={wall:8.3f} ms/req  body={size:,} bytes")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    body = build_payload(args.items)
+    client = build_client(body)
+    print(f"Payload: {args.items:,} mensajes ({len(body):,} bytes)")
+    await measure("json", json_mode, client, args.requests)
+    await measure("stream", stream_mode, client, args.requests)
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
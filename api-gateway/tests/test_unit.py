@@ -154,6 +154,1079 @@ class TestApplicationStructure:
         print("✅ Test 16 passed: CORS middleware configured")
 
 
+class TestConnectionPooling:
+    """Pruebas del pool de conexiones por servicio"""
+    
+    @pytest.mark.asyncio
+    async def test_client_pool_limits_and_timeouts(self):
+        """Test 17: Verificar límites y timeouts separados por servicio"""
+        from app.clients.base import ServiceClient
+        
+        client = ServiceClient("https://test.example.com", name="test", max_connections=7, read_timeout=2.5)
+        assert client.limits.max_connections == 7
+        assert client.limits.max_keepalive_connections <= 7
+        assert client.timeout.read == 2.5
+        assert client.timeout.connect == settings.HTTP_CONNECT_TIMEOUT
+        assert client.timeout.pool == settings.HTTP_POOL_TIMEOUT
+        await client.aclose()
+        print("✅ Test 17 passed: Pool limits and timeouts configured")
+    
+    @pytest.mark.asyncio
+    async def test_client_reopen_after_close(self):
+        """Test 18: Verificar que el cliente se reabre tras cerrarse"""
+        from app.clients.base import ServiceClient
+        
+        client = ServiceClient("https://test.example.com", name="test")
+        await client.aclose()
+        assert client.client.is_closed
+        await client.open()
+        assert not client.client.is_closed
+        await client.aclose()
+        print("✅ Test 18 passed: Client reopened after close")
+    
+    def test_one_client_per_service(self):
+        """Test 19: Verificar un único cliente registrado por servicio"""
+        from app.clients.base import SERVICE_CLIENTS, files_client
+        
+        assert SERVICE_CLIENTS["files"] is files_client
+        assert len({id(c) for c in SERVICE_CLIENTS.values()}) == len(SERVICE_CLIENTS)
+        print("✅ Test 19 passed: One client per service")
+
+
+class TestCircuitBreaker:
+    """Pruebas del circuit breaker y del timeout adaptativo"""
+    
+    def test_breaker_opens_on_failure_rate(self):
+        """Test 20: Verificar que el circuito se abre y pasa a half-open"""
+        from app.clients.breaker import CircuitBreaker
+        
+        breaker = CircuitBreaker(window_size=10, min_calls=4, failure_rate=0.5, open_seconds=0.05, half_open_max_calls=1)
+        for _ in range(2):
+            breaker.record_success()
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow_request()
+        
+        import time
+        time.sleep(0.06)
+        assert breaker.allow_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        print("✅ Test 20 passed: Breaker opens and recovers")
+    
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast(self):
+        """Test 21: Verificar 503 inmediato con el circuito abierto"""
+        import httpx
+        from fastapi import HTTPException
+        from app.clients.base import ServiceClient
+        
+        client = ServiceClient("https://test.example.com", name="test")
+        with patch.object(client.client, 'request', new_callable=AsyncMock) as mock_request:
+            mock_request.side_effect = httpx.ConnectError("down")
+            for _ in range(settings.BREAKER_MIN_CALLS):
+                with pytest.raises(HTTPException):
+                    await client.get("/test")
+            calls = mock_request.await_count
+            
+            with pytest.raises(HTTPException) as exc:
+                await client.get("/test")
+            assert exc.value.status_code == 503
+            assert "Retry-After" in exc.value.headers
+            assert mock_request.await_count == calls
+        assert client.health()["state"] == "open"
+        await client.aclose()
+        print("✅ Test 21 passed: Open circuit fails fast")
+    
+    def test_adaptive_timeout_bounds(self):
+        """Test 22: Verificar timeout adaptativo acotado"""
+        from app.clients.breaker import AdaptiveTimeout
+        
+        timeout = AdaptiveTimeout(maximum=30.0, minimum=1.0, percentile=0.99, multiplier=3.0, min_samples=5)
+        assert timeout.current() == 30.0
+        for _ in range(10):
+            timeout.observe(0.1)
+        assert timeout.current() == 1.0
+        for _ in range(10):
+            timeout.observe(2.0)
+        assert timeout.current() == 6.0
+        print("✅ Test 22 passed: Adaptive timeout bounded")
+
+
+class TestResponseCache:
+    """Pruebas del cache de respuestas GET"""
+    
+    @staticmethod
+    def _mock_response(payload):
+        response = Mock()
+        response.status_code = 200
+        response.json.return_value = payload
+        return response
+    
+    @pytest.mark.asyncio
+    async def test_cached_get_hits_downstream_once(self):
+        """Test 23: Verificar que un GET cacheado llega una sola vez al servicio"""
+        from app.clients.base import ServiceClient
+        
+        client = ServiceClient("https://test.example.com", name="cache-test-1")
+        with patch.object(client.client, 'request', new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = self._mock_response({"id": "c1"})
+            for _ in range(3):
+                result = await client.get("/v1/channels/c1", cache_ttl=30, cache_subject="u1")
+            assert result == {"id": "c1"}
+            assert mock_request.await_count == 1
+            
+            # Otro sujeto no comparte la entrada
+            await client.get("/v1/channels/c1", cache_ttl=30, cache_subject="u2")
+            assert mock_request.await_count == 2
+            
+            client.invalidate("/v1/channels/c1")
+            await client.get("/v1/channels/c1", cache_ttl=30, cache_subject="u1")
+            assert mock_request.await_count == 3
+        await client.aclose()
+        print("✅ Test 23 passed: Cached GET hits downstream once")
+    
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self):
+        """Test 24: Verificar que se sirve la copia stale y se refresca en segundo plano"""
+        import asyncio
+        from app.clients.base import ServiceClient, _background_refreshes
+        
+        client = ServiceClient("https://test.example.com", name="cache-test-2")
+        with patch.object(client.client, 'request', new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = self._mock_response({"online": 1})
+            await client.get("/stats", cache_ttl=0.01)
+            await asyncio.sleep(0.02)
+            
+            mock_request.return_value = self._mock_response({"online": 2})
+            assert await client.get("/stats", cache_ttl=0.01) == {"online": 1}
+            await asyncio.gather(*list(_background_refreshes))
+            assert mock_request.await_count == 2
+            assert await client.get("/stats", cache_ttl=30) == {"online": 2}
+        await client.aclose()
+        print("✅ Test 24 passed: Stale-while-revalidate works")
+    
+    def test_presence_stats_route_not_shadowed(self):
+        """Test 25: Verificar que /presence/stats no queda tapado por /{user_id}"""
+        from app.routes.presence import router
+        
+        paths = [route.path for route in router.routes]
+        assert paths.index("/presence/stats") < paths.index("/presence/{user_id}")
+        print("✅ Test 25 passed: Presence stats route reachable")
+
+
+class TestSingleflight:
+    """Pruebas del coalescing de GETs concurrentes"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_gets_share_one_call(self):
+        """Test 26: Verificar que GETs idénticos concurrentes hacen una sola llamada"""
+        import asyncio
+        from app.clients.base import ServiceClient
+        
+        client = ServiceClient("https://test.example.com", name="singleflight-test")
+        release = asyncio.Event()
+        
+        async def slow_request(**kwargs):
+            await release.wait()
+            response = Mock()
+            response.status_code = 200
+            response.json.return_value = {"online": 3}
+            return response
+        
+        with patch.object(client.client, 'request', new_callable=AsyncMock) as mock_request:
+            mock_request.side_effect = slow_request
+            waiters = [asyncio.ensure_future(client.get("/presence")) for _ in range(5)]
+            other = asyncio.ensure_future(client.get("/presence", params={"status": "online"}))
+            await asyncio.sleep(0)
+            release.set()
+            results = await asyncio.gather(*waiters, other)
+            
+            assert all(result == {"online": 3} for result in results)
+            assert mock_request.await_count == 2
+            assert client.health()["coalesced_requests"] == 4
+        await client.aclose()
+        print("✅ Test 26 passed: Concurrent GETs coalesced")
+
+
+class TestStreamingPassthrough:
+    """Pruebas del modo pass-through en streaming"""
+    
+    @staticmethod
+    def _client_with_transport(handler):
+        import httpx
+        from app.clients.base import ServiceClient
+        
+        client = ServiceClient("https://test.example.com", name="stream-test")
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return client
+    
+    @pytest.mark.asyncio
+    async def test_stream_forwards_bytes_and_headers(self):
+        """Test 27: Verificar que se reenvían bytes, status y headers seleccionados"""
+        import httpx
+        
+        body = b'[{"id": 1, "content": "hola"}]'
+        
+        def handler(request):
+            assert request.headers["Accept-Encoding"] == "identity"
+            return httpx.Response(
+                200,
+                stream=httpx.ByteStream(body),
+                headers={"Content-Type": "application/json", "ETag": "v1", "X-Internal": "secreto"},
+            )
+        
+        client = self._client_with_transport(handler)
+        response = await client.stream("GET", "/threads/t1/messages")
+        chunks = [chunk async for chunk in response.body_iterator]
+        await response.background()
+        
+        assert b"".join(chunks) == body
+        assert response.status_code == 200
+        assert response.headers["etag"] == "v1"
+        assert "x-internal" not in response.headers
+        await client.aclose()
+        print("✅ Test 27 passed: Stream forwards bytes and headers")
+    
+    @pytest.mark.asyncio
+    async def test_stream_error_keeps_contract(self):
+        """Test 28: Verificar que los errores se propagan como HTTPException"""
+        import httpx
+        from fastapi import HTTPException
+        
+        client = self._client_with_transport(
+            lambda request: httpx.Response(404, json={"detail": "Thread not found"})
+        )
+        with pytest.raises(HTTPException) as exc:
+            await client.stream("GET", "/threads/t1/messages")
+        assert exc.value.status_code == 404
+        assert exc.value.detail == {"detail": "Thread not found"}
+        await client.aclose()
+        print("✅ Test 28 passed: Stream errors keep contract")
+
+
+class TestAuthCache:
+    """Pruebas del cache de tokens verificados"""
+    
+    @pytest.mark.asyncio
+    async def test_get_auth_returns_token_and_claims(self):
+        """Test 29: Verificar que get_auth retorna token y claims y los cachea"""
+        import time
+        from jose import jwt
+        from fastapi.security import HTTPAuthorizationCredentials
+        from app.auth import get_auth, _verified_tokens
+        
+        token = jwt.encode({"sub": "u1", "exp": int(time.time()) + 60}, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        
+        auth = await get_auth(credentials)
+        assert auth.token == token
+        assert auth.claims["sub"] == "u1"
+        
+        with patch("app.auth.jwt.decode") as mock_decode:
+            assert (await get_auth(credentials)).claims["sub"] == "u1"
+            mock_decode.assert_not_called()
+        _verified_tokens.invalidate(token)
+        print("✅ Test 29 passed: get_auth caches verified tokens")
+    
+    @pytest.mark.asyncio
+    async def test_cached_token_expires(self):
+        """Test 30: Verificar que un token cacheado deja de valer al expirar"""
+        import time
+        from jose import jwt
+        from fastapi import HTTPException
+        from fastapi.security import HTTPAuthorizationCredentials
+        from app.auth import get_auth, _verified_tokens
+        
+        token = jwt.encode({"sub": "u2", "exp": int(time.time()) + 60}, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        await get_auth(credentials)
+        
+        with patch("app.auth.time.time", return_value=time.time() + 120):
+            with pytest.raises(HTTPException) as exc:
+                await get_auth(credentials)
+        assert exc.value.status_code == 401
+        
+        bad = HTTPAuthorizationCredentials(scheme="Bearer", credentials="no-es-un-jwt")
+        with pytest.raises(HTTPException):
+            await get_auth(bad)
+        assert _verified_tokens.get("no-es-un-jwt") is None
+        print("✅ Test 30 passed: Expired tokens rejected")
+
+
+class TestChannelOverview:
+    """Pruebas de la vista agregada de canal"""
+    
+    def test_overview_tolerates_partial_failures(self):
+        """Test 31: Verificar que el overview agrega secciones y reporta fallos parciales"""
+        from fastapi import HTTPException
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.auth import AuthContext, get_auth
+        from app.clients.base import presence_client
+        from app.routes import channels
+        
+        async def channel_get(path, **kwargs):
+            if path.startswith("/v1/members/channel/"):
+                return [
+                    {"user_id": "u1", "role": "owner"},
+                    {"user_id": "u2", "role": "member"},
+                    {"id": "membership-3", "role": "member"},
+                ]
+            return {"id": "c1", "name": "general", "is_active": True}
+        
+        async def presence_get(path, **kwargs):
+            if path.endswith("/u2"):
+                raise HTTPException(status_code=404, detail="not found")
+            return {"userId": "u1", "status": "online"}
+        
+        app.dependency_overrides[get_auth] = lambda: AuthContext(token="t", claims={"sub": "u1"})
+        try:
+            with patch.object(channels.channel_client, "get", side_effect=channel_get), \
+                 patch.object(channels.threads_client, "get", new_callable=AsyncMock) as threads_get, \
+                 patch.object(presence_client, "get", side_effect=presence_get):
+                threads_get.side_effect = HTTPException(status_code=503, detail="Service unavailable")
+                response = TestClient(app).get("/channels/c1/overview")
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["channel"]["name"] == "general"
+        assert len(data["members"]) == 3
+        assert data["presence"] == {"u1": {"userId": "u1", "status": "online"}, "u2": None}
+        assert data["threads"] is None
+        assert data["errors"]["threads"]["status_code"] == 503
+        print("✅ Test 31 passed: Overview tolerates partial failures")
+
+
+class TestThreadChannelCheck:
+    """Pruebas de la validación del canal al crear threads"""
+    
+    @pytest.mark.asyncio
+    async def test_cache_mode_skips_channel_get(self):
+        """Test 32: Verificar que con el estado cacheado no se consulta el canal"""
+        from app.auth import AuthContext
+        from app.routes import channels
+        
+        channels._remember_channel("c-cached", {"id": "c-cached", "is_active": True})
+        with patch.object(settings, "THREAD_CHANNEL_CHECK", "cache"), \
+             patch.object(channels.channel_client, "get", new_callable=AsyncMock) as channel_get, \
+             patch.object(channels.threads_client, "post", new_callable=AsyncMock) as thread_post:
+            thread_post.return_value = {"id": "t1"}
+            result = await channels.create_thread(
+                {"channel_id": "c-cached", "title": "hola"},
+                AuthContext(token="t", claims={"sub": "u1"})
+            )
+        assert result == {"id": "t1"}
+        channel_get.assert_not_called()
+        
+        channels._invalidate_channel("c-cached")
+        assert channels._channel_status.get("c-cached") is None
+        print("✅ Test 32 passed: Cached channel status used")
+    
+    @pytest.mark.asyncio
+    async def test_optimistic_mode_compensates(self):
+        """Test 33: Verificar que el modo optimista elimina el thread si el canal no existe"""
+        from fastapi import HTTPException
+        from app.auth import AuthContext
+        from app.routes import channels
+        
+        with patch.object(settings, "THREAD_CHANNEL_CHECK", "optimistic"), \
+             patch.object(channels.channel_client, "get", new_callable=AsyncMock) as channel_get, \
+             patch.object(channels.threads_client, "post", new_callable=AsyncMock) as thread_post, \
+             patch.object(channels.threads_client, "delete", new_callable=AsyncMock) as thread_delete:
+            channel_get.side_effect = HTTPException(status_code=404, detail="not found")
+            thread_post.return_value = {"id": "t-orphan"}
+            with pytest.raises(HTTPException) as exc:
+                await channels.create_thread(
+                    {"channel_id": "c-missing", "title": "hola"},
+                    AuthContext(token="t", claims={"sub": "u1"})
+                )
+        assert exc.value.status_code == 404
+        thread_delete.assert_awaited_once()
+        assert thread_delete.await_args.args[0] == "/v1/t-orphan"
+        print("✅ Test 33 passed: Optimistic create compensated")
+
+
+class TestPresenceBatch:
+    """Pruebas de presencia en lote"""
+    
+    @pytest.mark.asyncio
+    async def test_batch_resolves_and_caches(self):
+        """Test 34: Verificar que el lote consulta cada usuario una vez y cachea"""
+        from fastapi import HTTPException
+        from app.clients.base import presence_client
+        from app.routes.presence import get_presence_batch
+        
+        async def presence_get(path, **kwargs):
+            user_id = path.rsplit("/", 1)[-1]
+            if user_id == "b-missing":
+                raise HTTPException(status_code=404, detail="not found")
+            return {"userId": user_id, "status": "online"}
+        
+        with patch.object(presence_client, "get", side_effect=presence_get) as mock_get:
+            body = {"user_ids": ["b-1", "b-2", "b-1", "b-missing"]}
+            first = await get_presence_batch(body, None)
+            second = await get_presence_batch(body, None)
+        
+        assert first == second
+        assert first["presence"]["b-1"]["status"] == "online"
+        assert first["presence"]["b-missing"] is None
+        assert mock_get.call_count == 3
+        print("✅ Test 34 passed: Presence batch resolved and cached")
+    
+    @pytest.mark.asyncio
+    async def test_large_batch_uses_single_listing(self):
+        """Test 35: Verificar que un lote grande usa un solo listado filtrado"""
+        from app.clients.base import presence_client
+        from app.routes.presence import get_presence_many
+        
+        user_ids = [f"l-{i}" for i in range(settings.PRESENCE_BATCH_LIST_THRESHOLD + 1)]
+        listing = [{"userId": user_id, "status": "away"} for user_id in user_ids[:-1]]
+        with patch.object(presence_client, "get", new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = listing
+            result = await get_presence_many(user_ids)
+        
+        mock_get.assert_awaited_once_with("/api/v1.0.0/presence")
+        assert result[user_ids[0]]["status"] == "away"
+        assert result[user_ids[-1]] is None
+        print("✅ Test 35 passed: Large batch uses one listing call")
+
+
+class TestHeartbeatCoalescing:
+    """Pruebas del buffer de heartbeats de presencia"""
+    
+    @pytest.mark.asyncio
+    async def test_heartbeats_deduplicated_per_user(self):
+        """Test 36: Verificar que los heartbeats se agrupan por usuario con el último status"""
+        from app.heartbeats import HeartbeatBuffer
+        
+        send = AsyncMock()
+        buffer = HeartbeatBuffer(send, interval=60, concurrency=5)
+        for _ in range(100):
+            buffer.absorb("u1", {"heartbeat": True})
+        buffer.absorb("u2", {"heartbeat": True})
+        buffer.absorb("u2", {"status": "away"})
+        buffer.absorb("u2", {"status": "online", "heartbeat": True})
+        
+        assert await buffer.flush() == 2
+        sent = {call.args[0]: call.args[1] for call in send.await_args_list}
+        assert sent == {"u1": {"heartbeat": True}, "u2": {"status": "online"}}
+        assert await buffer.flush() == 0
+        print("✅ Test 36 passed: Heartbeats deduplicated per user")
+    
+    @pytest.mark.asyncio
+    async def test_failed_status_retried(self):
+        """Test 37: Verificar que un status fallido se reintenta y un 4xx se descarta"""
+        from fastapi import HTTPException
+        from app.heartbeats import HeartbeatBuffer
+        
+        send = AsyncMock(side_effect=[HTTPException(status_code=503, detail="down"), None])
+        buffer = HeartbeatBuffer(send, interval=60, concurrency=5)
+        buffer.absorb("u1", {"status": "offline"})
+        await buffer.flush()
+        assert buffer.pending_status("u1") == "offline"
+        await buffer.flush()
+        assert buffer.snapshot()["sent"] == 1
+        
+        buffer.send = AsyncMock(side_effect=HTTPException(status_code=404, detail="not found"))
+        buffer.absorb("u2", {"status": "online"})
+        await buffer.flush()
+        assert buffer.pending_status("u2") is None
+        print("✅ Test 37 passed: Failed status retried")
+    
+    @pytest.mark.asyncio
+    async def test_patch_coalesces_only_pure_valid_updates(self):
+        """Test 49: Verificar que sólo se encolan status válidos o heartbeat=true"""
+        import json
+        from fastapi import HTTPException
+        from app.clients.base import presence_client
+        from app.routes import presence
+        
+        with patch.object(presence_client, "patch", new_callable=AsyncMock) as mock_patch:
+            mock_patch.return_value = {"userId": "p-49", "status": "online"}
+            queued = await presence.update_user_presence("p-49", {"status": "offline"})
+            with pytest.raises(HTTPException) as exc:
+                await presence.update_user_presence("p-49", {"status": "away"})
+            both = await presence.update_user_presence("p-49", {"status": "online", "heartbeat": True})
+        
+        assert queued.status_code == 202
+        assert json.loads(queued.body) == {"userId": "p-49", "status": "offline", "queued": True}
+        assert exc.value.status_code == 422
+        assert both == {"userId": "p-49", "status": "online"}
+        mock_patch.assert_awaited_once_with(
+            "/api/v1.0.0/presence/p-49", json={"status": "online", "heartbeat": True}
+        )
+        presence.heartbeats.discard("p-49")
+        print("✅ Test 49 passed: Only pure valid presence updates are coalesced")
+    
+    @pytest.mark.asyncio
+    async def test_patch_proxies_false_heartbeat_and_null_status(self):
+        """Test 50: Verificar que heartbeat=false y status=null se envían sin cambios"""
+        from app.clients.base import presence_client
+        from app.routes import presence
+        
+        with patch.object(presence_client, "patch", new_callable=AsyncMock) as mock_patch:
+            mock_patch.return_value = {"userId": "p-50"}
+            await presence.update_user_presence("p-50", {"heartbeat": False})
+            await presence.update_user_presence("p-50", {"status": None})
+        
+        assert [call.kwargs["json"] for call in mock_patch.await_args_list] == [
+            {"heartbeat": False},
+            {"status": None},
+        ]
+        assert presence.heartbeats.pending_status("p-50") is None
+        assert "p-50" not in presence.heartbeats._pending
+        print("✅ Test 50 passed: Non-coalescable presence bodies proxied unchanged")
+
+
+# Tamaño de los archivos sintéticos de las pruebas de streaming; se puede subir
+# a varios GB (p.ej. GATEWAY_STREAM_TEST_BYTES=4294967296) sin cambiar el techo de memoria
+STREAM_TEST_BYTES = int(os.getenv("GATEWAY_STREAM_TEST_BYTES", str(64 * 1024 * 1024)))
+STREAM_TEST_CHUNK = 1024 * 1024
+STREAM_MEMORY_CEILING = 16 * 1024 * 1024
+
+
+def _synthetic_chunks(total: int):
+    chunk = bytes(range(256)) * (STREAM_TEST_CHUNK // 256)
+    sent = 0
+    while sent < total:
+        size = min(STREAM_TEST_CHUNK, total - sent)
+        yield chunk if size == STREAM_TEST_CHUNK else chunk[:size]
+        sent += size
+
+
+class TestStreamingFiles:
+    """Pruebas de subida y descarga de archivos en streaming contra un stub local"""
+    
+    @staticmethod
+    def _stub_client():
+        import hashlib
+        import httpx
+        from app.clients.base import ServiceClient
+        
+        class AsyncChunks(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                for chunk in _synthetic_chunks(STREAM_TEST_BYTES):
+                    yield chunk
+        
+        class StubFilesTransport(httpx.AsyncBaseTransport):
+            """Stub del servicio de archivos que consume el body sin guardarlo"""
+            received = 0
+            params = None
+            
+            async def handle_async_request(self, request):
+                if request.method == "POST":
+                    StubFilesTransport.params = dict(request.url.params)
+                    async for chunk in request.stream:
+                        StubFilesTransport.received += len(chunk)
+                    return httpx.Response(201, json={"id": "f1", "size": StubFilesTransport.received})
+                return httpx.Response(
+                    200,
+                    headers={"Content-Type": "application/octet-stream", "Content-Length": str(STREAM_TEST_BYTES)},
+                    stream=AsyncChunks(),
+                )
+        
+        client = ServiceClient("http://files.stub", name="files-stub")
+        client.client = httpx.AsyncClient(transport=StubFilesTransport())
+        return client, StubFilesTransport
+    
+    @pytest.mark.asyncio
+    async def test_upload_streams_with_bounded_memory(self):
+        """Test 38: Verificar subida en streaming con SHA256 incremental y memoria acotada"""
+        import hashlib
+        import tracemalloc
+        from app.routes.files import stream_upload
+        
+        expected = hashlib.sha256()
+        for chunk in _synthetic_chunks(STREAM_TEST_BYTES):
+            expected.update(chunk)
+        boundary = "gatewayboundary"
+        
+        async def body():
+            yield (
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"checksum_sha256\"\r\n\r\n"
+                f"{expected.hexdigest()}\r\n"
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"upload\"; filename=\"big.bin\"\r\n"
+                f"Content-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+            for chunk in _synthetic_chunks(STREAM_TEST_BYTES):
+                yield chunk
+            yield f"\r\n--{boundary}--\r\n".encode()
+        
+        client, stub = self._stub_client()
+        tracemalloc.start()
+        try:
+            result = await stream_upload(
+                client, body(), f"multipart/form-data; boundary={boundary}", {},
+                {"message_id": "m1", "thread_id": "t1"}
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        await client.aclose()
+        
+        assert result["checksum_sha256"] == expected.hexdigest()
+        assert stub.received > STREAM_TEST_BYTES
+        assert stub.params == {"message_id": "m1", "thread_id": "t1"}
+        assert peak < STREAM_MEMORY_CEILING
+        print(f"✅ Test 38 passed: Streaming upload ({STREAM_TEST_BYTES:,} bytes, peak {peak:,} bytes)")
+    
+    @pytest.mark.asyncio
+    async def test_upload_checksum_mismatch_rejected(self):
+        """Test 39: Verificar que un checksum declarado incorrecto se rechaza"""
+        from fastapi import HTTPException
+        from app.routes.files import stream_upload
+        
+        client, _ = self._stub_client()
+        boundary = "b"
+        
+        async def body():
+            yield (
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"checksum_sha256\"\r\n\r\n{'0' * 64}\r\n"
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"upload\"; filename=\"a.txt\"\r\n\r\n"
+                f"hola\r\n--{boundary}--\r\n"
+            ).encode()
+        
+        with patch.object(client, "delete", new_callable=AsyncMock) as mock_delete:
+            with pytest.raises(HTTPException) as exc:
+                await stream_upload(client, body(), f"multipart/form-data; boundary={boundary}", {})
+        assert exc.value.status_code == 400
+        mock_delete.assert_awaited_once()
+        await client.aclose()
+        print("✅ Test 39 passed: Checksum mismatch rejected")
+    
+    @pytest.mark.asyncio
+    async def test_download_streams_with_bounded_memory(self):
+        """Test 40: Verificar descarga en streaming con memoria acotada"""
+        import tracemalloc
+        
+        client, _ = self._stub_client()
+        tracemalloc.start()
+        try:
+            response = await client.stream_url("http://minio.stub/bucket/big.bin?X-Amz-Signature=x")
+            received = 0
+            async for chunk in response.body_iterator:
+                received += len(chunk)
+            await response.background()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        await client.aclose()
+        
+        assert received == STREAM_TEST_BYTES
+        assert response.headers["content-length"] == str(STREAM_TEST_BYTES)
+        assert peak < STREAM_MEMORY_CEILING
+        print(f"✅ Test 40 passed: Streaming download ({STREAM_TEST_BYTES:,} bytes, peak {peak:,} bytes)")
+
+
+class TestPresignCache:
+    """Pruebas del cache de URLs pre-firmadas"""
+    
+    @pytest.mark.asyncio
+    async def test_presign_shared_with_per_user_authorization(self):
+        """Test 41: Verificar URL compartida entre usuarios con autorización por usuario"""
+        from datetime import datetime, timezone
+        from fastapi import HTTPException
+        from app.auth import AuthContext
+        from app.clients.base import files_client
+        from app.routes.files import presign_download
+        
+        signed_at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        presign = {"url": f"http://minio/bucket/f-shared?X-Amz-Date={signed_at}&X-Amz-Expires=900"}
+        
+        async def metadata(path, headers=None, **kwargs):
+            if headers["Authorization"] == "Bearer t3":
+                raise HTTPException(status_code=403, detail="forbidden")
+            return {"id": "f-shared"}
+        
+        with patch.object(files_client, "post", new_callable=AsyncMock) as mock_post, \
+             patch.object(files_client, "get", side_effect=metadata) as mock_get:
+            mock_post.return_value = presign
+            first = await presign_download("f-shared", AuthContext(token="t1", claims={"sub": "u1"}))
+            again = await presign_download("f-shared", AuthContext(token="t1", claims={"sub": "u1"}))
+            other = await presign_download("f-shared", AuthContext(token="t2", claims={"sub": "u2"}))
+            with pytest.raises(HTTPException) as exc:
+                await presign_download("f-shared", AuthContext(token="t3", claims={"sub": "u3"}))
+        
+        assert first == again == other == presign
+        assert mock_post.await_count == 1
+        assert mock_get.call_count == 2
+        assert exc.value.status_code == 403
+        print("✅ Test 41 passed: Presigned URL shared with per-user checks")
+    
+    @pytest.mark.asyncio
+    async def test_presign_batch_reports_errors(self):
+        """Test 42: Verificar el presign en lote con errores por archivo"""
+        from fastapi import HTTPException
+        from app.auth import AuthContext
+        from app.clients.base import files_client
+        from app.routes.files import get_download_urls
+        
+        async def presign(path, **kwargs):
+            file_id = path.split("/")[3]
+            if file_id == "f-missing":
+                raise HTTPException(status_code=404, detail="File not found")
+            return {"url": f"http://minio/{file_id}", "expires_in": 600}
+        
+        with patch.object(files_client, "post", side_effect=presign):
+            result = await get_download_urls(
+                {"file_ids": ["f-a", "f-b", "f-missing", "f-a"]},
+                AuthContext(token="t1", claims={"sub": "u1"})
+            )
+        
+        assert set(result["urls"]) == {"f-a", "f-b"}
+        assert result["errors"]["f-missing"]["status_code"] == 404
+        print("✅ Test 42 passed: Presign batch reports per-file errors")
+
+
+class TestModerationPrefilter:
+    """Pruebas del pre-filtro local de blacklist"""
+    
+    @pytest.mark.asyncio
+    async def test_matcher_whole_words_and_incremental_updates(self):
+        """Test 43: Verificar coincidencias por palabra completa y altas/bajas incrementales"""
+        from app.blacklist import BlacklistMatcher
+        
+        async def fetch_page(limit, skip):
+            words = [
+                {"id": "1", "word": "idiota", "severity": "high"},
+                {"id": "2", "word": "tonto", "severity": "low"},
+                {"id": "3", "word": "mala palabra", "severity": "critical"},
+            ]
+            return {"words": words[skip:skip + limit]}
+        
+        matcher = BlacklistMatcher(fetch_page, min_severity="high", sync_interval=300, page_size=2)
+        assert matcher.blocking_words("eres un IDIOTA") == []
+        await matcher.sync()
+        
+        assert matcher.blocking_words("eres un IDIÓTA!") == [("idiota", 3)]
+        assert matcher.blocking_words("idiotas todos") == []
+        assert matcher.blocking_words("que tonto") == []
+        assert matcher.blocking_words("dijo una mala palabra") == [("mala palabra", 4)]
+        
+        matcher.add({"id": "4", "word": "tonto", "severity": "high"})
+        assert matcher.blocking_words("que tonto") == [("tonto", 3)]
+        matcher.remove("4")
+        assert matcher.blocking_words("que tonto") == []
+        matcher.remove("1")
+        assert matcher.blocking_words("eres un idiota") == []
+        print("✅ Test 43 passed: Blacklist matcher with incremental updates")
+    
+    @pytest.mark.asyncio
+    async def test_check_blocks_locally_and_forwards_the_rest(self):
+        """Test 44: Verificar bloqueo local de /moderation/check y reenvío del resto"""
+        import asyncio
+        from app.clients.base import moderation_client
+        from app.routes import moderation
+        
+        moderation.blacklist.replace([{"id": "w1", "word": "insulto", "severity": "high"}])
+        verdict = {
+            "is_approved": True, "action": "approved", "severity": "none",
+            "toxicity_score": 0.01, "strike_count": 0, "message": "OK", "detected_words": [],
+        }
+        try:
+            with patch.object(moderation_client, "post", new_callable=AsyncMock) as mock_post:
+                mock_post.return_value = verdict
+                blocked = await moderation.check_content(
+                    {"content": "un INSULTO directo", "message_id": "m1", "user_id": "u1", "channel_id": "c1"}
+                )
+                # El bloqueo local responde sin esperar al modelo; el reporte va en segundo plano
+                assert mock_post.await_count == 0
+                await asyncio.gather(*moderation._hit_reports)
+                assert mock_post.await_count == 1
+                assert mock_post.await_args.kwargs["json"]["message_id"] == "m1"
+                
+                forwarded = await moderation.check_content({"content": "hola a todos", "message_id": "m2"})
+                assert forwarded == verdict
+                assert mock_post.await_count == 2
+        finally:
+            moderation.blacklist.replace([])
+            moderation.blacklist.synced = False
+        
+        # Mismo formato que ModerateMessageResponse del servicio
+        assert set(blocked) == set(verdict)
+        assert blocked["is_approved"] is False
+        assert blocked["action"] == "blocked"
+        assert blocked["severity"] == "high"
+        assert blocked["detected_words"] == ["insulto"]
+        print("✅ Test 44 passed: Moderation check blocked locally and forwarded otherwise")
+    
+    @pytest.mark.asyncio
+    async def test_inactive_words_do_not_block(self):
+        """Test 51: Verificar que las palabras desactivadas no bloquean"""
+        from app.blacklist import BlacklistMatcher
+        
+        matcher = BlacklistMatcher(AsyncMock(), min_severity="low", sync_interval=300, page_size=100)
+        matcher.replace([
+            {"id": "1", "word": "baneada", "severity": "high", "is_active": False, "is_regex": False},
+            {"id": "2", "word": "vigente", "severity": "high", "is_active": True, "is_regex": False},
+        ])
+        assert matcher.blocking_words("palabra baneada") == []
+        assert matcher.blocking_words("palabra vigente") == [("vigente", 3)]
+        matcher.add({"id": "2", "word": "vigente", "severity": "high", "is_active": False})
+        assert matcher.blocking_words("palabra vigente") == []
+        print("✅ Test 51 passed: Inactive blacklist words do not block")
+    
+    @pytest.mark.asyncio
+    async def test_regex_words_left_to_the_service(self):
+        """Test 52: Verificar que los patrones regex no se evalúan localmente y el mensaje va al servicio"""
+        from app.clients.base import moderation_client
+        from app.routes import moderation
+        
+        moderation.blacklist.replace([
+            {"id": "r1", "word": "id[i1]ota", "severity": "high", "is_active": True, "is_regex": True},
+        ])
+        try:
+            assert moderation.blacklist.snapshot()["words"] == 0
+            with patch.object(moderation_client, "post", new_callable=AsyncMock) as mock_post:
+                mock_post.return_value = {"is_approved": False, "action": "warning"}
+                result = await moderation.check_content(
+                    {"content": "eres un id1ota", "message_id": "m52", "user_id": "u52", "channel_id": "c52"}
+                )
+        finally:
+            moderation.blacklist.replace([])
+            moderation.blacklist.synced = False
+        
+        assert result["action"] == "warning"
+        assert mock_post.await_count == 1
+        print("✅ Test 52 passed: Regex blacklist patterns left to the service")
+    
+    @pytest.mark.asyncio
+    async def test_added_word_removed_by_service_id(self):
+        """Test 54: Verificar que una palabra agregada se indexa con el id de SuccessResponse"""
+        from app.auth import AuthContext
+        from app.clients.base import moderation_client
+        from app.routes import moderation
+        
+        auth = AuthContext(token="t", claims={"sub": "admin"})
+        moderation.blacklist.replace([])
+        try:
+            with patch.object(moderation_client, "post", new_callable=AsyncMock) as mock_post, \
+                    patch.object(moderation_client, "delete", new_callable=AsyncMock) as mock_delete:
+                mock_post.return_value = {"success": True, "message": "Palabra agregada", "data": {"id": "w-54"}}
+                mock_delete.return_value = {"success": True, "message": "Palabra eliminada", "data": None}
+                await moderation.add_to_blacklist({"word": "malote", "severity": "high"}, auth)
+                assert moderation.blacklist.blocking_words("eres malote") == [("malote", 3)]
+                await moderation.remove_from_blacklist("w-54", auth)
+            assert moderation.blacklist.blocking_words("eres malote") == []
+        finally:
+            moderation.blacklist.replace([])
+            moderation.blacklist.synced = False
+        print("✅ Test 54 passed: Blacklist word indexed by the service id")
+
+
+class TestModerationVerdictCache:
+    """Pruebas del cache de veredictos de moderación"""
+    
+    @pytest.mark.asyncio
+    async def test_repeated_content_reuses_approved_verdict(self):
+        """Test 45: Verificar que el contenido repetido reutiliza el veredicto aprobado"""
+        from app.clients.base import moderation_client
+        from app.routes import moderation
+        
+        approved = {
+            "is_approved": True,
+            "action": "approved",
+            "severity": "none",
+            "toxicity_score": 0.02,
+            "strike_count": 0,
+            "message": "Mensaje aprobado",
+            "detected_words": [],
+            "language": "es",
+            "ban_info": None,
+        }
+        
+        async def check(path, json=None, **kwargs):
+            return dict(approved)
+        
+        with patch.object(moderation_client, "post", side_effect=check) as mock_post:
+            first = await moderation.check_content(
+                {"content": "Hola a todos 👋", "message_id": "v1", "user_id": "vu1", "channel_id": "vc1"}
+            )
+            second = await moderation.check_content(
+                {"content": "  hola   a TODOS 👋", "message_id": "v2", "user_id": "vu1", "channel_id": "vc1"}
+            )
+            # Un usuario sin veredicto limpio reciente siempre pasa por el servicio
+            other = await moderation.check_content(
+                {"content": "Hola a todos 👋", "message_id": "v3", "user_id": "vu2", "channel_id": "vc1"}
+            )
+            anonymous = await moderation.check_content({"content": "Hola a todos 👋", "message_id": "v4"})
+        
+        assert mock_post.call_count == 3
+        assert first == approved
+        assert second == approved
+        assert other == approved and anonymous == approved
+        assert moderation.verdicts.snapshot()["hits"] >= 1
+        print("✅ Test 45 passed: Approved moderation verdict reused for repeated content")
+    
+    @pytest.mark.asyncio
+    async def test_strikes_bypass_verdict_cache(self):
+        """Test 46: Verificar que un usuario con strikes no usa el cache y lo no aprobado no se cachea"""
+        from app.verdicts import VerdictCache
+        
+        def verdict(action, strike_count=0, **extra):
+            return {
+                "is_approved": action == "approved",
+                "action": action,
+                "severity": "none" if action == "approved" else "medium",
+                "toxicity_score": 0.01 if action == "approved" else 0.8,
+                "strike_count": strike_count,
+                "message": "",
+                "detected_words": [],
+                **extra,
+            }
+        
+        cache = VerdictCache(100, ttl=60, clean_ttl=60)
+        approved = verdict("approved")
+        cache.record({"content": "buenas", "user_id": "a", "channel_id": "c"}, approved)
+        cache.record({"content": "buenas", "user_id": "b", "channel_id": "c"}, approved)
+        cache.record({"content": "eres lo peor", "user_id": "b", "channel_id": "c"}, verdict("warning", 1))
+        
+        assert cache.lookup({"content": "buenas", "user_id": "a", "channel_id": "c"}) == approved
+        assert cache.lookup({"content": "eres lo peor", "user_id": "a", "channel_id": "c"}) is None
+        # b recibió un strike: vuelve al servicio aunque el contenido esté cacheado
+        assert cache.lookup({"content": "buenas", "user_id": "b", "channel_id": "c"}) is None
+        assert cache.lookup({"content": "buenas", "user_id": "b", "channel_id": "otro"}) is None
+        
+        # Aprobado pero con strikes acumulados: no se cachea ni marca al usuario como limpio
+        cache.record({"content": "hola", "user_id": "d", "channel_id": "c"}, verdict("approved", 2))
+        assert cache.lookup({"content": "hola", "user_id": "a", "channel_id": "c"}) is None
+        assert cache.lookup({"content": "buenas", "user_id": "d", "channel_id": "c"}) is None
+        
+        # Sin is_approved ni action se usa is_toxic como respaldo
+        cache.record({"content": "ok", "user_id": "e", "channel_id": "c"}, {"is_toxic": False})
+        cache.record({"content": "bloqueado", "user_id": "a", "channel_id": "c"}, {"is_approved": False, "is_toxic": False})
+        assert cache.lookup({"content": "ok", "user_id": "e", "channel_id": "c"}) == {"is_toxic": False}
+        assert cache.lookup({"content": "ok", "user_id": "a", "channel_id": "c"}) is None
+        assert cache.snapshot()["bypassed"] == 4
+        print("✅ Test 46 passed: Strike state bypasses the verdict cache")
+
+
+class TestModerationBatching:
+    """Pruebas del micro-batching de /moderation/check"""
+    
+    @pytest.mark.asyncio
+    async def test_burst_dispatched_as_batches(self):
+        """Test 47: Verificar que una ráfaga sale en lotes y cada caller recibe su veredicto"""
+        import asyncio
+        from app.batching import MicroBatcher
+        
+        batches = []
+        
+        async def send_batch(items):
+            batches.append(len(items))
+            return [{"message_id": item["message_id"], "is_toxic": False} for item in items]
+        
+        batcher = MicroBatcher(AsyncMock(), send_batch, window=0.01, max_size=4, concurrency=2)
+        results = await asyncio.gather(*(batcher.submit({"message_id": f"b{i}"}) for i in range(6)))
+        
+        assert [r["message_id"] for r in results] == [f"b{i}" for i in range(6)]
+        assert batches == [4, 2]
+        assert batcher.send_one.await_count == 0
+        assert batcher.snapshot()["batch_calls"] == 2
+        print("✅ Test 47 passed: Moderation burst dispatched as batches")
+    
+    @pytest.mark.asyncio
+    async def test_fan_out_bounded_with_individual_errors(self):
+        """Test 48: Verificar el reparto acotado sin endpoint de lotes y errores por caller"""
+        import asyncio
+        from fastapi import HTTPException
+        from app.batching import MicroBatcher
+        
+        active = 0
+        peak = 0
+        
+        async def send_one(item):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.005)
+            active -= 1
+            if item == "bad":
+                raise HTTPException(status_code=422, detail="invalid")
+            return item.upper()
+        
+        async def no_batch_endpoint(items):
+            raise HTTPException(status_code=404, detail="Not Found")
+        
+        batcher = MicroBatcher(send_one, no_batch_endpoint, window=0.01, max_size=50, concurrency=3)
+        results = await asyncio.gather(
+            *(batcher.submit(item) for item in ["a", "b", "bad", "c", "d", "e"]),
+            return_exceptions=True
+        )
+        
+        assert results[:2] == ["A", "B"] and results[3:] == ["C", "D", "E"]
+        assert isinstance(results[2], HTTPException) and results[2].status_code == 422
+        assert peak == 3
+        assert batcher.send_batch is None
+        print("✅ Test 48 passed: Bounded fan-out with per-caller errors")
+    
+    @pytest.mark.asyncio
+    async def test_fan_out_limit_shared_across_batches(self):
+        """Test 53: Verificar que el límite de concurrencia se respeta con varios lotes en vuelo"""
+        import asyncio
+        from app.batching import MicroBatcher
+        
+        active = 0
+        peak = 0
+        
+        async def send_one(item):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return item * 2
+        
+        # max_size=2 despacha un lote nuevo cada dos items, todos se solapan
+        batcher = MicroBatcher(send_one, None, window=0.01, max_size=2, concurrency=3)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(12)))
+        
+        assert results == [i * 2 for i in range(12)]
+        assert batcher.snapshot()["batches"] == 6
+        assert peak == 3
+        print("✅ Test 53 passed: Fan-out limit shared across overlapping batches")
+    
+    @pytest.mark.asyncio
+    async def test_direct_checks_bounded_without_batch_endpoint(self):
+        """Test 55: Verificar que sin endpoint de lotes /check va directo pero acotado"""
+        import asyncio
+        from app.batching import MicroBatcher
+        from app.clients.base import moderation_client
+        from app.routes import moderation
+        
+        active = 0
+        peak = 0
+        
+        async def check(path, json=None, **kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return {"is_approved": True, "action": "approved", "strike_count": 0}
+        
+        batcher = MicroBatcher(moderation._check_one, None, window=1.0, max_size=32, concurrency=2)
+        with patch.object(moderation, "check_batcher", batcher), \
+                patch.object(moderation_client, "post", side_effect=check) as mock_post:
+            results = await asyncio.gather(
+                *(moderation.check_content({"content": f"mensaje {i}", "message_id": f"d{i}"}) for i in range(6))
+            )
+        
+        assert all(result["action"] == "approved" for result in results)
+        assert mock_post.call_count == 6
+        assert peak == 2
+        # Sin ventana: nada se encoló como lote
+        assert batcher.snapshot()["batches"] == 0
+        assert batcher.snapshot()["single_calls"] == 6
+        print("✅ Test 55 passed: Direct moderation checks bounded without a batch endpoint")
+
+
 def run_all_tests():
     """Ejecutar todas las pruebas unitarias"""
     print("\n" + "="*80)
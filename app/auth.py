@@ -1,3 +1,6 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from passlib.context import CryptContext
@@ -13,6 +16,89 @@ def hash_password(p: str) -> str:
 def verify_password(p: str, hashed: str) -> bool:
     return pwd_ctx.verify(p, hashed)
 
+
+class HashingOverloaded(Exception):
+    """La cola del pool de hashing está llena; el request debe responder 503."""
+
+
+class HashPool:
+    """Pool acotado de hilos para bcrypt.
+
+    bcrypt libera el GIL mientras calcula, así que un ThreadPoolExecutor basta
+    para sacar el hashing del event loop. `max_pending` limita trabajos en
+    cola + en ejecución: por sobre ese límite se rechaza en vez de acumular.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._hash_total = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="bcrypt"
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise HashingOverloaded()
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            result = fn(*args)
+            return result, started - submitted, time.perf_counter() - started
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, waited, took = await loop.run_in_executor(self._get_executor(), job)
+        finally:
+            self._pending -= 1
+
+        self._completed += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._hash_total += took
+        return result
+
+    def snapshot(self) -> dict:
+        done = self._completed or 1
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "queue_wait_avg_ms": round(self._wait_total / done * 1000, 3),
+            "queue_wait_max_ms": round(self._wait_max * 1000, 3),
+            "hash_time_avg_ms": round(self._hash_total / done * 1000, 3),
+        }
+
+
+hash_pool = HashPool(settings.HASH_POOL_WORKERS, settings.HASH_POOL_MAX_PENDING)
+
+async def hash_password_async(p: str) -> str:
+    return await hash_pool.run(hash_password, p)
+
+async def verify_password_async(p: str, hashed: str) -> bool:
+    return await hash_pool.run(verify_password, p, hashed)
+
 def create_access_token(sub: str, extra: Optional[dict] = None) -> str:
     data = {"sub": sub, "exp": datetime.now(timezone.utc) + timedelta(minutes=settings.JWT_EXPIRES_MIN)}
     if extra:
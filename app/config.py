@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -6,12 +7,51 @@ class Settings(BaseSettings):
     ENV: str = "dev"
 
     DATABASE_URL: str
+    # Modo asíncrono (asyncpg). Si DATABASE_ASYNC_URL no se define se deriva
+    # de DATABASE_URL cambiando el driver a +asyncpg.
+    DB_ASYNC: bool = False
+    DATABASE_ASYNC_URL: Optional[str] = None
+
+    # Pool de conexiones por proceso. Con el HPA, el total de conexiones es
+    # réplicas * workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW): mantenerlo bajo
+    # max_connections de Postgres.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_POOL_RECYCLE: int = 1800
+    # pre-ping agrega un round trip por checkout; con DB_POOL_RECYCLE menor al
+    # idle timeout del servidor/proxy se puede desactivar.
+    DB_POOL_PRE_PING: bool = True
+
     JWT_SECRET: str
     JWT_ALG: str = "HS256"
     JWT_EXPIRES_MIN: int = 60
 
     RABBITMQ_URL: str
     RABBITMQ_EXCHANGE: str = "users.events"
+    RABBITMQ_CONNECT_TIMEOUT: float = 5.0
+    RABBITMQ_CHANNEL_POOL_SIZE: int = 8
+    RABBITMQ_PUBLISHER_CONFIRMS: bool = True
+
+    # Outbox de eventos (publicación en segundo plano)
+    OUTBOX_DISPATCHER_ENABLED: bool = True
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 1.0
+    OUTBOX_MAX_BACKOFF: float = 30.0
+    # Intentos antes de dejar un evento como dead letter (sólo cuentan las
+    # fallas de ese evento con el broker disponible)
+    OUTBOX_MAX_ATTEMPTS: int = 10
+
+    # POST /v1/users/batch: máximo de ids+usernames por petición
+    USERS_BATCH_MAX: int = 1000
+
+    # Cache de usuarios autenticados (id -> snapshot) por proceso
+    USER_CACHE_TTL_SECONDS: float = 30.0
+    USER_CACHE_MAX_ENTRIES: int = 10000
+
+    # Pool de hashing bcrypt (fuera del event loop)
+    HASH_POOL_WORKERS: int = 4
+    HASH_POOL_MAX_PENDING: int = 64
 
     class Config:
         env_file = ".env"
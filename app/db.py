@@ -1,15 +1,166 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
+from typing import Union
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.concurrency import run_in_threadpool
 
 from .config import settings
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+class PoolStats:
+    """Tiempos de espera para obtener una conexión del pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        if timed_out:
+            self.timeouts += 1
+            return
+        self.checkouts += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def snapshot(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / (self.checkouts or 1) * 1000, 3),
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+class _TimedPoolMixin:
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return conn
+
+
+def _timed_pool(base):
+    stats = PoolStats()
+    return type(f"Timed{base.__name__}", (_TimedPoolMixin, base), {"stats": stats})
+
+
+def _engine_kwargs(url: str, pool_base) -> dict:
+    kwargs = {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # SQLite en memoria usa SingletonThreadPool: no acepta tamaño de pool
+        return kwargs
+    kwargs.update(
+        poolclass=_timed_pool(pool_base),
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    return kwargs
+
+
+engine = create_engine(settings.DATABASE_URL, **_engine_kwargs(settings.DATABASE_URL, QueuePool))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Tipo de la sesión que entrega get_db según el modo configurado
+DbSession = Union[Session, AsyncSession]
+
+
+def _async_database_url() -> str:
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+    url = make_url(settings.DATABASE_URL)
+    return url.set(drivername=f"{url.get_backend_name()}+asyncpg").render_as_string(hide_password=False)
+
+
+# Modo asíncrono (asyncpg): sólo se construye si DB_ASYNC=true
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC:
+    _url = _async_database_url()
+    async_engine = create_async_engine(_url, **_engine_kwargs(_url, AsyncAdaptedQueuePool))
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+def new_session() -> DbSession:
+    """Sesión del modo configurado, para uso fuera de un request."""
+    if AsyncSessionLocal is not None:
+        return AsyncSessionLocal()
+    return SessionLocal()
+
+
+async def close_session(db: DbSession) -> None:
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
+
+
+async def get_db():
+    """Entrega una Session (modo sync) o una AsyncSession (DB_ASYNC=true).
+
+    Los handlers no llaman a la sesión directamente: usan `run_db`, que
+    funciona igual con ambas.
+    """
+    db = new_session()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        await close_session(db)
+
+
+async def run_db(db, fn, *args):
+    """Ejecuta `fn(session, *args)` sin bloquear el event loop.
+
+    - AsyncSession: `run_sync` corre `fn` sobre el driver asyncpg, así que
+      muchas consultas pueden quedar en vuelo a la vez en un solo worker.
+    - Session: `fn` corre en el threadpool de Starlette.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+
+def _pool_status(pool) -> dict:
+    status = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=settings.DB_MAX_OVERFLOW,
+        )
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
+
+
+def pool_status() -> dict:
+    """Estado de los pools de conexión (para /metrics)."""
+    status = {"sync": _pool_status(engine.pool)}
+    if async_engine is not None:
+        status["async"] = _pool_status(async_engine.pool)
+    return status
+
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
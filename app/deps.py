@@ -1,17 +1,18 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
 from uuid import UUID
-from .db import get_db
+from .db import DbSession, get_db, run_db
 from .models import User
+from .schemas import UserOut
 from .auth import decode_token
+from .cache import user_cache
 
 oauth2_scheme = HTTPBearer(auto_error=True)
 
-def get_current_user(
-    db: Session = Depends(get_db),
+async def get_current_user(
+    db: DbSession = Depends(get_db),
     creds: HTTPAuthorizationCredentials = Depends(oauth2_scheme),
-) -> User:
+) -> UserOut:
     token = creds.credentials  # <-- este es el JWT en texto
     try:
         data = decode_token(token)
@@ -22,7 +23,23 @@ def get_current_user(
             detail="Invalid token",
         )
 
-    user = db.get(User, UUID(uid))
+    try:
+        user_id = UUID(uid)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+        )
+
+    # Sólo se cachean usuarios activos; un inactivo siempre vuelve a la BD
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    user = await run_db(db, lambda s: s.get(User, user_id))
     if not user or not user.is_active:
         raise HTTPException(status_code=401, detail="Inactive or missing user")
-    return user
+
+    snapshot = UserOut.model_validate(user)
+    user_cache.set(user_id, snapshot)
+    return snapshot
@@ -1,34 +1,121 @@
 import asyncio
 import json
-from typing import Literal, Optional
+import logging
+from typing import Iterable, Literal, Optional, Sequence, Tuple
+from uuid import UUID
 import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractRobustConnection
+from aio_pika.pool import Pool
 
 from .config import settings
+from .cache import user_cache
 
-_exchange = None
-
-async def get_exchange():
-    global _exchange
-    if _exchange:
-        return _exchange
-    connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
-    channel = await connection.channel()
-    exchange = await channel.declare_exchange(settings.RABBITMQ_EXCHANGE, type=aio_pika.ExchangeType.TOPIC, durable=True)
-    _exchange = exchange
-    return _exchange
-
-async def publish_user_event(event_type: Literal["user.created", "user.updated"], payload: dict, user_id: str):
-    ex = await get_exchange()
-    message = aio_pika.Message(
-        body=json.dumps({
-            "type": event_type,
-            "version": "1.0",
-            "source": "users-service",
-            "user_id": user_id,
-            "payload": payload,
-        }).encode("utf-8"),
-        content_type="application/json",
-        delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+logger = logging.getLogger(__name__)
+
+EventType = Literal["user.created", "user.updated"]
+
+
+class EventPublisher:
+    """Publicador de eventos con una conexión persistente y un pool de canales.
+
+    La conexión se abre en el startup de la app (o en el primer publish si el
+    broker no estaba disponible) y cada publish toma un canal del pool, así
+    los publishers concurrentes no comparten un único canal. Con publisher
+    confirms activos, `publish_many` publica el lote en paralelo sobre un
+    canal y espera todas las confirmaciones juntas.
+    """
+
+    def __init__(self, url: str, exchange_name: str, channel_pool_size: int, confirms: bool):
+        self.url = url
+        self.exchange_name = exchange_name
+        self.channel_pool_size = channel_pool_size
+        self.confirms = confirms
+        self._connection: Optional[AbstractRobustConnection] = None
+        self._channels: Optional[Pool] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def start(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._channels is not None:
+                return
+            connection = await aio_pika.connect_robust(
+                self.url, timeout=settings.RABBITMQ_CONNECT_TIMEOUT
+            )
+            try:
+                channel = await connection.channel()
+                await channel.declare_exchange(
+                    self.exchange_name, type=aio_pika.ExchangeType.TOPIC, durable=True
+                )
+                await channel.close()
+            except Exception:
+                await connection.close()
+                raise
+            self._connection = connection
+            self._channels = Pool(self._open_channel, max_size=self.channel_pool_size)
+
+    async def _open_channel(self) -> AbstractChannel:
+        return await self._connection.channel(publisher_confirms=self.confirms)
+
+    async def close(self) -> None:
+        if self._channels is not None:
+            await self._channels.close()
+            self._channels = None
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def publish_many(self, events: Iterable[Tuple[str, bytes]]) -> None:
+        """Publica (routing_key, body) en un canal del pool y espera los confirms."""
+        if self._channels is None:
+            await self.start()
+        async with self._channels.acquire() as channel:
+            if channel.is_closed:
+                await channel.reopen()
+            exchange = await channel.get_exchange(self.exchange_name, ensure=False)
+            await asyncio.gather(*(
+                exchange.publish(
+                    aio_pika.Message(
+                        body=body,
+                        content_type="application/json",
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                    ),
+                    routing_key=routing_key,
+                )
+                for routing_key, body in events
+            ))
+
+
+publisher = EventPublisher(
+    settings.RABBITMQ_URL,
+    settings.RABBITMQ_EXCHANGE,
+    channel_pool_size=settings.RABBITMQ_CHANNEL_POOL_SIZE,
+    confirms=settings.RABBITMQ_PUBLISHER_CONFIRMS,
+)
+
+
+def encode_user_event(event_type: EventType, payload: dict, user_id: str) -> bytes:
+    return json.dumps({
+        "type": event_type,
+        "version": "1.0",
+        "source": "users-service",
+        "user_id": user_id,
+        "payload": payload,
+    }).encode("utf-8")
+
+
+async def publish_user_events(events: Sequence[Tuple[EventType, dict, str]]):
+    """Publica un lote de (event_type, payload, user_id) esperando los confirms."""
+    # routing key = tipo de evento (topic e.g., user.created / user.updated)
+    await publisher.publish_many(
+        (event_type, encode_user_event(event_type, payload, user_id))
+        for event_type, payload, user_id in events
     )
-    routing_key = event_type  # topic e.g., user.created / user.updated
-    await ex.publish(message, routing_key=routing_key)
+    for event_type, _, user_id in events:
+        if event_type == "user.updated":
+            user_cache.invalidate(UUID(user_id))
+
+
+async def publish_user_event(event_type: EventType, payload: dict, user_id: str):
+    await publish_user_events([(event_type, payload, user_id)])
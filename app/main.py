@@ -1,10 +1,16 @@
+from contextlib import asynccontextmanager
+import logging
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 import os
 
 from .config import settings
 from .routes.users import router as users_router
-from .db import Base, engine
+from .auth import hash_pool, HashingOverloaded
+from .cache import user_cache
+from .events import publisher
+from .outbox import outbox_dispatcher
+from .db import Base, engine, dispose_engines, pool_status
 from . import models  # noqa: F401  # asegura que los modelos se registren en Base.metadata
 
 
@@ -13,6 +19,25 @@ from . import models  # noqa: F401  # asegura que los modelos se registren en Ba
 # o bien utilizar el header X-Forwarded-Prefix en el proxy.
 root_path = os.getenv("ROOT_PATH", "")
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await publisher.start()
+    except Exception:
+        # El servicio arranca igual; el publisher reintenta en el primer evento
+        logger.warning("RabbitMQ no disponible al iniciar", exc_info=True)
+    if settings.OUTBOX_DISPATCHER_ENABLED:
+        outbox_dispatcher.start()
+    yield
+    await outbox_dispatcher.stop()
+    await publisher.close()
+    hash_pool.shutdown()
+    await dispose_engines()
+
+
 app = FastAPI(
     title="Users Service",
     version=settings.APP_VERSION,
@@ -22,6 +47,7 @@ app = FastAPI(
         "- Consulta y actualización del perfil del usuario.\n"
     ),
     root_path=root_path or "",
+    lifespan=lifespan,
 )
 
 @app.middleware("http")
@@ -46,6 +72,28 @@ def health():
     }
 
 
+@app.get("/metrics", tags=["meta"])
+def metrics():
+    return {
+        "hash_pool": hash_pool.snapshot(),
+        "db_pool": pool_status(),
+        "user_cache": user_cache.snapshot(),
+        "outbox": outbox_dispatcher.snapshot(),
+    }
+
+
+@app.exception_handler(HashingOverloaded)
+async def hashing_overloaded_handler(request: Request, exc: HashingOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={
+            "code": "hashing_overloaded",
+            "message": "Too many concurrent password operations, retry later",
+        },
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.exception_handler(Exception)
 async def default_handler(request: Request, exc: Exception):
     # Aquí podrías loguear la excepción antes de responder.
@@ -1,10 +1,16 @@
-from sqlalchemy import Column, String, Boolean, DateTime
+from sqlalchemy import Column, String, Boolean, DateTime, Index, BigInteger, Integer, JSON
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 import uuid
+from datetime import datetime, timezone
 
 from .db import Base
 
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -13,5 +19,31 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     full_name = Column(String(120), nullable=True)
     is_active = Column(Boolean, default=True)
+    # Default también en Python: el cursor de paginación compara created_at
+    # con el valor devuelto y debe tener la misma precisión que lo guardado.
+    created_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    # Login case-insensitive: lower(email) / lower(username) (ver migración 0002)
+    # Paginación keyset por (created_at, id) (ver migración 0004; los índices
+    # pg_trgm / text_pattern_ops para búsqueda sólo existen en PostgreSQL)
+    __table_args__ = (
+        Index("ix_users_email_lower", func.lower(email), unique=True),
+        Index("ix_users_username_lower", func.lower(username), unique=True),
+        Index("ix_users_created_at_id", created_at, id),
+    )
+
+
+class UserEventOutbox(Base):
+    """Eventos pendientes de publicar (Transactional Outbox).
+
+    Se insertan en la misma transacción que el cambio del usuario y el
+    OutboxDispatcher los publica en lotes y los borra al confirmarse.
+    """
+    __tablename__ = "user_events_outbox"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    event_type = Column(String(50), nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
\ No newline at end of file
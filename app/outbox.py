@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import close_session, new_session, run_db
+from .models import UserEventOutbox
+from . import events
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_user_event(s: Session, event_type: events.EventType, payload: dict, user_id: UUID) -> None:
+    """Agrega el evento a la transacción en curso (se publica tras el commit)."""
+    s.add(UserEventOutbox(event_type=event_type, payload=payload, user_id=user_id))
+
+
+def _claim_batch(s: Session, limit: int) -> list:
+    # Las filas que agotaron sus intentos quedan en la tabla como dead letters
+    stmt = (
+        select(UserEventOutbox)
+        .where(UserEventOutbox.attempts < settings.OUTBOX_MAX_ATTEMPTS)
+        .order_by(UserEventOutbox.id)
+        .limit(limit)
+    )
+    if s.get_bind().dialect.name == "postgresql":
+        # Varias réplicas pueden drenar en paralelo sin publicar dos veces
+        stmt = stmt.with_for_update(skip_locked=True)
+    return [
+        (row.id, row.event_type, row.payload, str(row.user_id))
+        for row in s.execute(stmt).scalars()
+    ]
+
+
+def _settle_batch(s: Session, published: list, failed: list) -> list:
+    """Borra lo publicado y cuenta un intento a lo que falló; retorna los nuevos dead letters."""
+    if published:
+        s.execute(delete(UserEventOutbox).where(UserEventOutbox.id.in_(published)))
+    dead = []
+    if failed:
+        s.execute(
+            update(UserEventOutbox)
+            .where(UserEventOutbox.id.in_(failed))
+            .values(attempts=UserEventOutbox.attempts + 1)
+        )
+        dead = s.execute(
+            select(UserEventOutbox.id).where(
+                UserEventOutbox.id.in_(failed),
+                UserEventOutbox.attempts >= settings.OUTBOX_MAX_ATTEMPTS,
+            )
+        ).scalars().all()
+    s.commit()
+    return dead
+
+
+class OutboxDispatcher:
+    """Tarea de fondo que drena user_events_outbox hacia el exchange.
+
+    Los handlers sólo escriben la fila y llaman a `notify()`; la latencia del
+    broker y sus reconexiones ya no se suman al tiempo de respuesta. Si el
+    broker falla, las filas quedan en la tabla y se reintentan.
+
+    Si un lote falla se publica evento por evento para aislar al que no se
+    puede enviar. Sólo en ese caso (el broker aceptó otros eventos) se le
+    cuenta un intento; al llegar a OUTBOX_MAX_ATTEMPTS deja de reclamarse.
+    Con el broker caído no se cuentan intentos.
+    """
+
+    def __init__(self, batch_size: int, poll_interval: float):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.published = 0
+        self.failures = 0
+        self.dead_letters = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def drain_once(self) -> int:
+        """Publica un lote; devuelve cuántos eventos salieron."""
+        db = new_session()
+        try:
+            batch = await run_db(db, _claim_batch, self.batch_size)
+            if not batch:
+                await run_db(db, lambda s: s.rollback())
+                return 0
+            try:
+                await events.publish_user_events([row[1:] for row in batch])
+                published, failed = [row[0] for row in batch], []
+            except Exception:
+                self.failures += 1
+                if len(batch) == 1:
+                    await run_db(db, lambda s: s.rollback())
+                    raise
+                published, failed = await self._publish_each(batch)
+                if not published:
+                    await run_db(db, lambda s: s.rollback())
+                    raise
+            dead = await run_db(db, _settle_batch, published, failed)
+            if dead:
+                self.dead_letters += len(dead)
+                logger.error("Eventos del outbox descartados tras %s intentos: %s",
+                             settings.OUTBOX_MAX_ATTEMPTS, dead)
+            self.published += len(published)
+            return len(published)
+        finally:
+            await close_session(db)
+
+    async def _publish_each(self, batch: list) -> tuple:
+        published, failed = [], []
+        for row in batch:
+            try:
+                await events.publish_user_events([row[1:]])
+                published.append(row[0])
+            except Exception:
+                failed.append(row[0])
+        return published, failed
+
+    async def _run(self) -> None:
+        backoff = self.poll_interval
+        while True:
+            self._wakeup.clear()
+            try:
+                sent = await self.drain_once()
+                backoff = self.poll_interval
+            except Exception:
+                logger.warning("No se pudo publicar el outbox de eventos", exc_info=True)
+                # Con el broker caído se ignora notify() y se espera con backoff
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, settings.OUTBOX_MAX_BACKOFF)
+                continue
+            if sent >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "published": self.published,
+            "failures": self.failures,
+            "dead_letters": self.dead_letters,
+        }
+
+
+outbox_dispatcher = OutboxDispatcher(settings.OUTBOX_BATCH_SIZE, settings.OUTBOX_POLL_INTERVAL)
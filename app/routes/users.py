@@ -1,19 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import any_, bindparam, case, func, insert as sa_insert, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
-from ..db import get_db
+from ..db import DbSession, get_db, run_db
 from ..models import User
 from ..schemas import (
     UserRegisterIn,
     UserLoginIn,
     UserUpdateIn,
+    UserBatchIn,
     UserOut,
+    UserBriefOut,
+    UserPageOut,
     TokenOut,
     ErrorOut,
 )
-from ..auth import hash_password, verify_password, create_access_token
-from ..events import publish_user_event
+from ..auth import hash_password_async, verify_password_async, create_access_token
+from ..outbox import enqueue_user_event, outbox_dispatcher
+from ..cache import user_cache
 from ..deps import get_current_user
 
 router = APIRouter(prefix="/v1", tags=["users"])
@@ -21,10 +34,33 @@ router = APIRouter(prefix="/v1", tags=["users"])
 # Mantén este valor en sync con la expiración usada en create_access_token()
 TOKEN_TTL_SECONDS = 60 * 60  # 1 hora
 
+# Columnas de UserOut: las consultas de lectura/RETURNING no cargan entidades
+_USER_OUT_COLUMNS = (User.id, User.email, User.username, User.full_name, User.is_active)
+
 
 # ------------------------------
 # Registro
 # ------------------------------
+_ON_CONFLICT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def _supports_on_conflict(s: Session) -> bool:
+    return s.get_bind().dialect.name in _ON_CONFLICT_INSERTS
+
+
+def _insert_user_stmt(s: Session, values: dict):
+    insert = _ON_CONFLICT_INSERTS[s.get_bind().dialect.name]
+    return insert(User).values(**values).on_conflict_do_nothing().returning(*_USER_OUT_COLUMNS)
+
+
+def _insert_user_fallback(s: Session, values: dict):
+    """Dialectos sin ON CONFLICT: el índice único decide y se mapea a 409."""
+    try:
+        return s.execute(sa_insert(User).values(**values).returning(*_USER_OUT_COLUMNS)).mappings().one()
+    except IntegrityError:
+        return None
+
+
 @router.post(
     "/users/register",
     response_model=UserOut,
@@ -32,37 +68,44 @@ TOKEN_TTL_SECONDS = 60 * 60  # 1 hora
     responses={
         201: {"description": "Usuario creado"},
         409: {"model": ErrorOut, "description": "Email o username ya existe"},
+        503: {"model": ErrorOut, "description": "Pool de hashing saturado"},
     },
 )
-async def register(body: UserRegisterIn, db: Session = Depends(get_db)):
-    # Verificar unicidad (email / username)
-    exists = db.execute(
-        select(User).where((User.email == body.email) | (User.username == body.username))
-    ).scalar_one_or_none()
-    if exists:
-        raise HTTPException(status_code=409, detail="email or username already exists")
+async def register(body: UserRegisterIn, db: DbSession = Depends(get_db)):
+    password_hash = await hash_password_async(body.password)
 
-    # Crear usuario
-    u = User(
-        email=body.email,
-        username=body.username,
-        full_name=body.full_name,
-        password_hash=hash_password(body.password),
-    )
-    db.add(u)
-    db.commit()
-    db.refresh(u)
-
-    # Emitir evento (no bloquear si falla)
-    try:
-        await publish_user_event(
+    def _create(s: Session):
+        # Un solo round trip: INSERT ... ON CONFLICT DO NOTHING RETURNING.
+        # Si no vuelve fila es porque email o username ya existían (incluido
+        # el caso de dos registros concurrentes).
+        values = dict(
+            email=body.email,
+            username=body.username,
+            full_name=body.full_name,
+            password_hash=password_hash,
+        )
+        if _supports_on_conflict(s):
+            row = s.execute(_insert_user_stmt(s, values)).mappings().one_or_none()
+        else:
+            row = _insert_user_fallback(s, values)
+        if row is None:
+            s.rollback()
+            return None
+        # El evento se confirma en la misma transacción que el usuario
+        enqueue_user_event(
+            s,
             "user.created",
-            {"email": u.email, "username": u.username, "full_name": u.full_name},
-            str(u.id),
+            {"email": row["email"], "username": row["username"], "full_name": row["full_name"]},
+            row["id"],
         )
-    except Exception:
-        pass  # aquí podrías loggear
+        s.commit()
+        return UserOut.model_validate(row)
 
+    u = await run_db(db, _create)
+    if u is None:
+        raise HTTPException(status_code=409, detail="email or username already exists")
+
+    outbox_dispatcher.notify()
     return u
 
 
@@ -75,17 +118,22 @@ async def register(body: UserRegisterIn, db: Session = Depends(get_db)):
     responses={
         200: {"description": "Login OK, devuelve JWT"},
         401: {"model": ErrorOut, "description": "Credenciales inválidas"},
+        503: {"model": ErrorOut, "description": "Pool de hashing saturado"},
     },
 )
-def login(body: UserLoginIn, db: Session = Depends(get_db)):
-    u = db.execute(
-        select(User).where(
-            (User.username == body.username_or_email)
-            | (User.email == body.username_or_email)
-        )
-    ).scalar_one_or_none()
+async def login(body: UserLoginIn, db: DbSession = Depends(get_db)):
+    # Una sola condición según haya '@', para que la consulta use exactamente
+    # uno de los índices lower() en vez de un plan con OR.
+    ident = body.username_or_email.strip().lower()
+    column = User.email if "@" in ident else User.username
+    u = await run_db(
+        db,
+        lambda s: s.execute(
+            select(User).where(func.lower(column) == ident)
+        ).scalar_one_or_none(),
+    )
 
-    if not u or not verify_password(body.password, u.password_hash):
+    if not u or not await verify_password_async(body.password, u.password_hash):
         raise HTTPException(status_code=401, detail="invalid credentials")
 
     token = create_access_token(sub=str(u.id), extra={"username": u.username})
@@ -107,7 +155,7 @@ def login(body: UserLoginIn, db: Session = Depends(get_db)):
     response_model=UserOut,
     responses={401: {"model": ErrorOut, "description": "No autorizado"}},
 )
-def me(current: User = Depends(get_current_user)):
+def me(current: UserOut = Depends(get_current_user)):
     return current
 
 
@@ -124,29 +172,163 @@ def me(current: User = Depends(get_current_user)):
 )
 async def update_me(
     body: UserUpdateIn,
-    db: Session = Depends(get_db),
-    current: User = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+    current: UserOut = Depends(get_current_user),
 ):
-    if body.full_name is not None:
-        current.full_name = body.full_name
+    # get_current_user entrega un snapshot (posiblemente cacheado): la
+    # escritura trabaja sobre la fila real.
+    def _update(s: Session):
+        user = s.get(User, current.id)
+        if body.full_name is not None:
+            user.full_name = body.full_name
 
-    db.add(current)
-    db.commit()
-    db.refresh(current)
+        s.add(user)
+        enqueue_user_event(s, "user.updated", {"full_name": user.full_name}, user.id)
+        s.commit()
+        s.refresh(user)
+        return user
 
-    # Emitir evento (no bloquear si falla)
-    try:
-        await publish_user_event(
-            "user.updated",
-            {"full_name": current.full_name},
-            str(current.id),
-        )
-    except Exception:
-        pass  
+    current = await run_db(db, _update)
+    user_cache.invalidate(current.id)
+    outbox_dispatcher.notify()
     return current
 
 
+# ------------------------------
+# Consulta masiva por ids / usernames (para otros servicios)
+# ------------------------------
+def _match_any(s: Session, column, values: list, element_type):
+    if s.get_bind().dialect.name == "postgresql":
+        # `= ANY(:array)`: un solo parámetro sin importar el tamaño del lote
+        return column == any_(bindparam(None, values, type_=ARRAY(element_type)))
+    return column.in_(values)
+
+
+def _find_users(s: Session, ids: list, usernames: list) -> list:
+    conditions = []
+    if ids:
+        conditions.append(_match_any(s, User.id, ids, User.id.type))
+    if usernames:
+        conditions.append(_match_any(s, func.lower(User.username), usernames, User.username.type))
+    return s.execute(select(*_USER_OUT_COLUMNS).where(or_(*conditions))).mappings().all()
+
+
+@router.post(
+    "/users/batch",
+    response_model=List[UserOut],
+    responses={
+        200: {"description": "Usuarios encontrados (los inexistentes se omiten)"},
+        401: {"model": ErrorOut, "description": "No autorizado"},
+        422: {"description": "Lote demasiado grande o inválido"},
+    },
+)
+async def users_batch(
+    body: UserBatchIn,
+    db: DbSession = Depends(get_db),
+    current: UserOut = Depends(get_current_user),
+):
+    ids = list(dict.fromkeys(body.ids))
+    usernames = list(dict.fromkeys(u.strip().lower() for u in body.usernames))
+    if not ids and not usernames:
+        return []
+
+    rows = await run_db(db, _find_users, ids, usernames)
+    return [UserOut.model_validate(row) for row in rows]
+
+
+# ------------------------------
+# Listado paginado y búsqueda por prefijo (autocompletado de menciones)
+# ------------------------------
+_USER_BRIEF_COLUMNS = (User.id, User.username, User.full_name)
+
+
+def _encode_cursor(created_at: datetime, user_id: UUID) -> str:
+    raw = json.dumps({"c": created_at.isoformat(), "i": str(user_id)})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(raw["c"]), UUID(raw["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def list_users_stmt(limit: int, after: Optional[tuple] = None):
+    # Keyset sobre (created_at, id): cada página es un index range scan de
+    # ix_users_created_at_id, sin OFFSET.
+    stmt = (
+        select(*_USER_BRIEF_COLUMNS, User.created_at)
+        .where(User.is_active.is_(True))
+        .order_by(User.created_at, User.id)
+        .limit(limit)
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(User.created_at, User.id) > tuple_(*after))
+    return stmt
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# pg_trgm sólo puede usar el índice con patrones de 3+ caracteres
+_TRIGRAM_MIN_LENGTH = 3
+
+
+def search_users_stmt(prefix: str, limit: int):
+    # username: prefijo (ix_users_username_prefix); full_name: cualquier
+    # palabra/parte del nombre (trigram). Primero los que calzan por username.
+    # Con 1-2 caracteres sólo se busca por prefijo de username: '%x%' sobre
+    # full_name recorrería y ordenaría casi toda la tabla.
+    needle = _like_escape(prefix.strip().lower())
+    by_username = func.lower(User.username).like(f"{needle}%", escape="\\")
+    stmt = select(*_USER_BRIEF_COLUMNS).limit(limit)
+    if len(prefix.strip()) < _TRIGRAM_MIN_LENGTH:
+        return stmt.where(User.is_active.is_(True), by_username).order_by(func.lower(User.username))
+    by_full_name = func.lower(User.full_name).like(f"%{needle}%", escape="\\")
+    return (
+        stmt
+        .where(User.is_active.is_(True), or_(by_username, by_full_name))
+        .order_by(case((by_username, 0), else_=1), func.lower(User.username))
+    )
 
 
+@router.get(
+    "/users",
+    response_model=UserPageOut,
+    responses={
+        400: {"model": ErrorOut, "description": "Cursor inválido"},
+        401: {"model": ErrorOut, "description": "No autorizado"},
+    },
+)
+async def list_users(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: DbSession = Depends(get_db),
+    current: UserOut = Depends(get_current_user),
+):
+    after = _decode_cursor(cursor) if cursor else None
+    # Se pide uno extra para saber si hay página siguiente sin un COUNT
+    rows = await run_db(db, lambda s: s.execute(list_users_stmt(limit + 1, after)).mappings().all())
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return UserPageOut(items=[UserBriefOut.model_validate(r) for r in rows], next_cursor=next_cursor)
 
 
+@router.get(
+    "/users/search",
+    response_model=List[UserBriefOut],
+    responses={401: {"model": ErrorOut, "description": "No autorizado"}},
+)
+async def search_users(
+    prefix: str = Query(..., min_length=1, max_length=50),
+    limit: int = Query(20, ge=1, le=100),
+    db: DbSession = Depends(get_db),
+    current: UserOut = Depends(get_current_user),
+):
+    rows = await run_db(db, lambda s: s.execute(search_users_stmt(prefix, limit)).mappings().all())
+    return [UserBriefOut.model_validate(r) for r in rows]
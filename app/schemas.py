@@ -1,11 +1,14 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from typing import List, Optional
 from uuid import UUID
 
+from .config import settings
+
 # Requests
 class UserRegisterIn(BaseModel):
     email: EmailStr
-    username: str = Field(min_length=3, max_length=50)
+    # Sin '@': el login distingue email de username por ese carácter
+    username: str = Field(min_length=3, max_length=50, pattern=r"^[^@]+$")
     password: str = Field(min_length=8)
     full_name: Optional[str] = None
 
@@ -16,6 +19,16 @@ class UserLoginIn(BaseModel):
 class UserUpdateIn(BaseModel):
     full_name: Optional[str] = None
 
+class UserBatchIn(BaseModel):
+    ids: List[UUID] = Field(default_factory=list)
+    usernames: List[str] = Field(default_factory=list)
+
+    @model_validator(mode="after")
+    def check_size(self):
+        if len(self.ids) + len(self.usernames) > settings.USERS_BATCH_MAX:
+            raise ValueError(f"at most {settings.USERS_BATCH_MAX} ids/usernames per request")
+        return self
+
 # Responses
 class UserOut(BaseModel):
     id: UUID
@@ -27,6 +40,19 @@ class UserOut(BaseModel):
     class Config:
         from_attributes = True
 
+class UserBriefOut(BaseModel):
+    """Vista pública mínima (sin email) para listados y autocompletado."""
+    id: UUID
+    username: str
+    full_name: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class UserPageOut(BaseModel):
+    items: List[UserBriefOut]
+    next_cursor: Optional[str] = None
+
 class TokenOut(BaseModel):
     access_token: str
     token_type: str = "bearer"
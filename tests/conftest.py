@@ -1,17 +1,24 @@
 # tests/conftest.py
 
+import asyncio
 import os
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 # 👉 Para tests: usar una DB SQLite local descartable
 os.environ["DATABASE_URL"] = "sqlite:///./test_users.db"
+# Misma DB vía aiosqlite para correr las rutas con AsyncSession (DB_ASYNC)
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./test_users.db"
+# El outbox se drena a mano en los tests (sin tarea de fondo)
+os.environ["OUTBOX_DISPATCHER_ENABLED"] = "false"
 
 from app.main import app
 from app.db import Base, engine, get_db
+from app import db as db_module
 from app import events as events_module
-from app.routes import users as users_routes
 
 # --- Inicializar schema en la DB de tests (SQLite) ---
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -34,15 +41,55 @@ app.dependency_overrides[get_db] = override_get_db
 
 
 # --- Stub de RabbitMQ: no queremos depender del broker en tests ---
-async def fake_publish_user_event(event_type: str, payload: dict, user_id: str):
-    return None
+published_events = []
 
 
-events_module.publish_user_event = fake_publish_user_event
-users_routes.publish_user_event = fake_publish_user_event
+async def fake_publish_user_events(events):
+    published_events.extend(events)
 
 
-@pytest.fixture(scope="session")
-def client():
-    with TestClient(app) as c:
-        yield c
+events_module.publish_user_events = fake_publish_user_events
+
+
+def _reset_schema():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(scope="session", params=["sync", "async"])
+def client(request):
+    """Cada test de rutas corre con Session (modo sync) y con AsyncSession."""
+    if request.param == "sync":
+        with TestClient(app) as c:
+            yield c
+        return
+
+    _reset_schema()
+    # NullPool: los tests usan más de un event loop (TestClient y asyncio.run)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_async_db():
+        db = AsyncTestingSessionLocal()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app.dependency_overrides[get_db] = override_get_async_db
+    # new_session() (outbox) entrega AsyncSession como con DB_ASYNC=true
+    db_module.AsyncSessionLocal = AsyncTestingSessionLocal
+    try:
+        with TestClient(app) as c:
+            yield c
+    finally:
+        db_module.AsyncSessionLocal = None
+        app.dependency_overrides[get_db] = override_get_db
+        asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture
+def outbox_events():
+    """Eventos publicados por el stub de RabbitMQ (se limpia en cada test)."""
+    published_events.clear()
+    return published_events
@@ -89,6 +89,21 @@ def test_register_rejects_duplicate_email_409(client):
     assert resp2.status_code == 409
 
 
+def test_register_rejects_duplicate_username_409(client):
+    resp1 = _register_user(client, "dup_name_1@example.com", "user_dup_name")
+    assert resp1.status_code == 201
+
+    resp2 = _register_user(client, "dup_name_2@example.com", "user_dup_name")
+    assert resp2.status_code == 409
+
+    # El primer usuario sigue pudiendo autenticarse (el conflicto no dejó basura)
+    resp = client.post(
+        "/v1/auth/login",
+        json={"username_or_email": "user_dup_name", "password": "S3gura123"},
+    )
+    assert resp.status_code == 200
+
+
 # ------------------------------
 # POST /v1/auth/login
 # ------------------------------
@@ -130,6 +145,45 @@ def test_login_fails_with_wrong_password(client):
     assert resp.status_code == 401
 
 
+def test_login_is_case_insensitive_for_email_and_username(client):
+    _register_user(client, "Case.Login@example.com", "CaseLogin")
+
+    for ident in ("case.login@EXAMPLE.com", "caselogin", "CASELOGIN"):
+        resp = client.post(
+            "/v1/auth/login",
+            json={"username_or_email": ident, "password": "S3gura123"},
+        )
+        assert resp.status_code == 200, ident
+
+
+def test_login_and_register_query_the_db_off_the_event_loop(client):
+    import asyncio
+    from sqlalchemy import event
+    from app.db import engine
+
+    on_loop = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(statement)
+        except RuntimeError:
+            pass
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        _create_user_and_get_token(client, "off_loop@example.com", "off_loop")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    # Ninguna consulta de register/login corre en el hilo del event loop
+    assert on_loop == []
+
+
+def test_register_rejects_username_differing_only_in_case_409(client):
+    assert _register_user(client, "case_dup_1@example.com", "CaseDup").status_code == 201
+    assert _register_user(client, "case_dup_2@example.com", "casedup").status_code == 409
+
+
 # ------------------------------
 # GET /v1/users/me
 # ------------------------------
@@ -186,3 +240,381 @@ def test_update_me_changes_full_name(client):
 def test_update_me_without_token_is_rejected(client):
     resp = client.patch("/v1/users/me", json={"full_name": "No importa"})
     assert resp.status_code in (401, 403)
+
+
+# ------------------------------
+# Pool de hashing (bcrypt fuera del event loop)
+# ------------------------------
+
+def test_metrics_reports_hash_pool(client):
+    _register_user(client, "metrics_hash@example.com", "metrics_hash")
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    data = resp.json()["hash_pool"]
+    assert data["completed"] >= 1
+    assert "queue_wait_avg_ms" in data
+    assert "hash_time_avg_ms" in data
+
+
+def test_register_sheds_load_with_503_when_hash_pool_is_full(client, monkeypatch):
+    from app.auth import hash_pool
+
+    monkeypatch.setattr(hash_pool, "max_pending", 0)
+    resp = _register_user(client, "shed@example.com", "shed_user")
+    assert resp.status_code == 503
+    assert resp.json()["code"] == "hashing_overloaded"
+    assert resp.headers.get("Retry-After") == "1"
+
+
+# ------------------------------
+# Modo asíncrono de base de datos
+# ------------------------------
+
+def test_async_database_url_is_derived_from_database_url(monkeypatch):
+    from app import db
+
+    monkeypatch.setattr(settings, "DATABASE_ASYNC_URL", None)
+    monkeypatch.setattr(settings, "DATABASE_URL", "postgresql+psycopg2://u:p@db:5432/usersdb")
+    assert db._async_database_url() == "postgresql+asyncpg://u:p@db:5432/usersdb"
+
+    monkeypatch.setattr(settings, "DATABASE_ASYNC_URL", "postgresql+asyncpg://other/usersdb")
+    assert db._async_database_url() == "postgresql+asyncpg://other/usersdb"
+
+
+def test_metrics_reports_db_pool_usage(client):
+    _register_user(client, "metrics_pool@example.com", "metrics_pool")
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    pool = resp.json()["db_pool"]["sync"]
+    assert pool["size"] == settings.DB_POOL_SIZE
+    assert pool["checkouts"] >= 1
+    assert pool["checked_out"] >= 0
+    assert "wait_avg_ms" in pool
+
+
+# ------------------------------
+# Cache de usuarios autenticados
+# ------------------------------
+
+def test_me_is_served_from_user_cache_and_refreshed_after_update(client):
+    from app.cache import user_cache
+
+    token = _create_user_and_get_token(client, "cache_me@example.com", "cache_me", full_name="Antes")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/v1/users/me", headers=headers).status_code == 200
+    hits_before = user_cache.hits
+    assert client.get("/v1/users/me", headers=headers).json()["full_name"] == "Antes"
+    assert user_cache.hits == hits_before + 1
+
+    resp = client.patch("/v1/users/me", json={"full_name": "Despues"}, headers=headers)
+    assert resp.status_code == 200
+
+    # La actualización invalida el snapshot: no se sirve el nombre anterior
+    assert client.get("/v1/users/me", headers=headers).json()["full_name"] == "Despues"
+    assert client.get("/metrics").json()["user_cache"]["hits"] >= 1
+
+
+# ------------------------------
+# Publicador de eventos (RabbitMQ simulado)
+# ------------------------------
+
+class _FakeExchange:
+    def __init__(self, fail_on=None):
+        self.published = []
+        self.fail_on = fail_on
+
+    async def publish(self, message, routing_key):
+        if routing_key == self.fail_on:
+            raise RuntimeError("nack")
+        self.published.append((routing_key, message.body))
+
+
+class _FakeChannel:
+    def __init__(self, exchange, publisher_confirms):
+        self.exchange = exchange
+        self.publisher_confirms = publisher_confirms
+        self.is_closed = False
+        self.reopened = 0
+
+    async def declare_exchange(self, name, **kwargs):
+        return self.exchange
+
+    async def get_exchange(self, name, ensure=True):
+        return self.exchange
+
+    async def reopen(self):
+        self.is_closed = False
+        self.reopened += 1
+
+    async def close(self):
+        self.is_closed = True
+
+
+class _FakeConnection:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.channels = []
+        self.closed = False
+
+    async def channel(self, publisher_confirms=True):
+        channel = _FakeChannel(self.exchange, publisher_confirms)
+        self.channels.append(channel)
+        return channel
+
+    async def close(self):
+        self.closed = True
+
+
+def _fake_broker(monkeypatch, exchange):
+    from app import events
+
+    connections = []
+
+    async def connect_robust(url, timeout=None):
+        connections.append(_FakeConnection(exchange))
+        return connections[-1]
+
+    monkeypatch.setattr(events.aio_pika, "connect_robust", connect_robust)
+    return connections
+
+
+def test_publisher_reuses_connection_and_pooled_channel(monkeypatch):
+    import asyncio
+    from app.events import EventPublisher
+
+    exchange = _FakeExchange()
+    connections = _fake_broker(monkeypatch, exchange)
+    publisher = EventPublisher("amqp://fake", "users.events", channel_pool_size=2, confirms=True)
+
+    async def scenario():
+        await publisher.start()
+        await publisher.publish_many([("user.created", b"1"), ("user.updated", b"2")])
+        await publisher.publish_many([("user.updated", b"3")])
+        await publisher.close()
+
+    asyncio.run(scenario())
+    assert len(connections) == 1
+    # Un canal para declarar el exchange y uno del pool, reutilizado
+    declare, pooled = connections[0].channels
+    assert declare.is_closed and pooled.publisher_confirms is True
+    assert exchange.published == [("user.created", b"1"), ("user.updated", b"2"), ("user.updated", b"3")]
+    assert connections[0].closed
+
+
+def test_publisher_reopens_closed_channel_and_reconnects_after_close(monkeypatch):
+    import asyncio
+    from app.events import EventPublisher
+
+    exchange = _FakeExchange()
+    connections = _fake_broker(monkeypatch, exchange)
+    publisher = EventPublisher("amqp://fake", "users.events", channel_pool_size=1, confirms=True)
+
+    async def scenario():
+        await publisher.publish_many([("user.created", b"1")])
+        pooled = connections[0].channels[-1]
+        pooled.is_closed = True
+        await publisher.publish_many([("user.created", b"2")])
+        assert pooled.reopened == 1
+        await publisher.close()
+        await publisher.publish_many([("user.created", b"3")])
+        await publisher.close()
+
+    asyncio.run(scenario())
+    assert len(connections) == 2
+    assert [body for _, body in exchange.published] == [b"1", b"2", b"3"]
+
+
+def test_publisher_propagates_confirm_failures(monkeypatch):
+    import asyncio
+    from app.events import EventPublisher
+
+    exchange = _FakeExchange(fail_on="user.updated")
+    _fake_broker(monkeypatch, exchange)
+    publisher = EventPublisher("amqp://fake", "users.events", channel_pool_size=1, confirms=True)
+
+    async def scenario():
+        try:
+            await publisher.publish_many([("user.created", b"1"), ("user.updated", b"2")])
+        finally:
+            await publisher.close()
+
+    # El lote falla entero: el outbox lo reintenta
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+
+
+# ------------------------------
+# Outbox de eventos
+# ------------------------------
+
+def test_register_and_update_write_events_to_outbox(client, outbox_events):
+    import asyncio
+    from app.outbox import outbox_dispatcher
+
+    # Vaciar lo que hayan dejado otros tests
+    while asyncio.run(outbox_dispatcher.drain_once()):
+        pass
+    outbox_events.clear()
+
+    token = _create_user_and_get_token(client, "outbox@example.com", "outbox_user", full_name="Uno")
+    client.patch(
+        "/v1/users/me",
+        json={"full_name": "Dos"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert asyncio.run(outbox_dispatcher.drain_once()) == 2
+    assert [e[0] for e in outbox_events] == ["user.created", "user.updated"]
+    assert outbox_events[0][1]["username"] == "outbox_user"
+    assert outbox_events[1][1] == {"full_name": "Dos"}
+
+    # Publicados y borrados: no se vuelven a enviar
+    assert asyncio.run(outbox_dispatcher.drain_once()) == 0
+
+
+def test_outbox_dead_letters_poison_event_after_max_attempts(client, monkeypatch):
+    import asyncio
+    from sqlalchemy import select
+    from app import events
+    from app.db import run_db, new_session, close_session
+    from app.models import UserEventOutbox
+    from app.outbox import outbox_dispatcher
+
+    while asyncio.run(outbox_dispatcher.drain_once()):
+        pass
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 2)
+    poison = _register_user(client, "poison@example.com", "poison_user").json()["id"]
+    sent = []
+
+    async def publish(batch):
+        if any(user_id == poison for _, _, user_id in batch):
+            raise RuntimeError("rejected by broker")
+        sent.extend(user_id for _, _, user_id in batch)
+
+    monkeypatch.setattr(events, "publish_user_events", publish)
+
+    # Solo, el evento no cuenta intentos (no se distingue de un broker caído)
+    with pytest.raises(RuntimeError):
+        asyncio.run(outbox_dispatcher.drain_once())
+
+    # Con otros eventos en el lote, éstos salen y al envenenado se le cuenta un intento
+    for i in range(2):
+        other = _register_user(client, f"healthy_{i}@example.com", f"healthy_{i}").json()["id"]
+        assert asyncio.run(outbox_dispatcher.drain_once()) == 1
+        assert sent[-1] == other
+
+    # Agotó sus intentos: ya no se reclama ni bloquea la cabeza del outbox
+    assert asyncio.run(outbox_dispatcher.drain_once()) == 0
+
+    async def attempts():
+        db = new_session()
+        try:
+            return await run_db(db, lambda s: s.execute(select(UserEventOutbox.attempts)).scalars().all())
+        finally:
+            await close_session(db)
+
+    assert asyncio.run(attempts()) == [2]
+    assert outbox_dispatcher.snapshot()["dead_letters"] >= 1
+
+
+# ------------------------------
+# POST /v1/users/batch
+# ------------------------------
+
+def test_users_batch_resolves_ids_and_usernames(client):
+    token = _create_user_and_get_token(client, "batch_caller@example.com", "batch_caller")
+    headers = {"Authorization": f"Bearer {token}"}
+    a = _register_user(client, "batch_a@example.com", "batch_a").json()
+    _register_user(client, "batch_b@example.com", "Batch_B")
+
+    resp = client.post(
+        "/v1/users/batch",
+        json={
+            "ids": [a["id"], "00000000-0000-0000-0000-000000000000"],
+            "usernames": ["batch_b", "no_existe"],
+        },
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    assert sorted(u["username"] for u in resp.json()) == ["Batch_B", "batch_a"]
+
+
+def test_users_batch_rejects_oversized_requests(client, monkeypatch):
+    token = _create_user_and_get_token(client, "batch_max@example.com", "batch_max")
+    monkeypatch.setattr(settings, "USERS_BATCH_MAX", 2)
+
+    resp = client.post(
+        "/v1/users/batch",
+        json={"usernames": ["a", "b", "c"]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert resp.status_code == 422
+
+
+# ------------------------------
+# GET /v1/users y GET /v1/users/search
+# ------------------------------
+
+def test_list_users_paginates_with_cursor_without_gaps(client):
+    token = _create_user_and_get_token(client, "list_caller@example.com", "list_caller")
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(5):
+        _register_user(client, f"list_{i}@example.com", f"list_{i}")
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        resp = client.get("/v1/users", params=params, headers=headers)
+        assert resp.status_code == 200
+        page = resp.json()
+        assert len(page["items"]) <= 2
+        assert all("email" not in u for u in page["items"])
+        seen.extend(u["id"] for u in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen) == len(set(seen))
+    usernames = {
+        u["username"]
+        for u in client.post("/v1/users/batch", json={"ids": seen}, headers=headers).json()
+    }
+    assert {f"list_{i}" for i in range(5)} <= usernames
+
+
+def test_list_users_rejects_invalid_cursor(client):
+    token = _create_user_and_get_token(client, "list_bad@example.com", "list_bad")
+    resp = client.get(
+        "/v1/users",
+        params={"cursor": "no-es-un-cursor"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert resp.status_code == 400
+
+
+def test_search_users_by_username_prefix_and_full_name(client):
+    token = _create_user_and_get_token(client, "search_caller@example.com", "search_caller")
+    headers = {"Authorization": f"Bearer {token}"}
+    _register_user(client, "mention1@example.com", "MentionOne", full_name="Ana Perez")
+    _register_user(client, "mention2@example.com", "other_mention", full_name="Mentiroso Diaz")
+
+    resp = client.get("/v1/users/search", params={"prefix": "menti"}, headers=headers)
+    assert resp.status_code == 200
+    names = [u["username"] for u in resp.json()]
+    # Primero los que calzan por username, luego por nombre completo
+    assert names == ["MentionOne", "other_mention"]
+
+    # 1-2 caracteres: sólo prefijo de username, no coincidencias dentro del nombre
+    resp = client.get("/v1/users/search", params={"prefix": "di"}, headers=headers)
+    assert "other_mention" not in [u["username"] for u in resp.json()]
+    resp = client.get("/v1/users/search", params={"prefix": "dia"}, headers=headers)
+    assert "other_mention" in [u["username"] for u in resp.json()]
+
+    # Los comodines de LIKE se tratan como texto literal
+    resp = client.get("/v1/users/search", params={"prefix": "%"}, headers=headers)
+    assert resp.json() == []